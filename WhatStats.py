@@ -1,4 +1,22 @@
-from core.main import WhatStats
+import logging
+import sys
+from multiprocessing import freeze_support
 
 if __name__ == '__main__':
-    WhatStats().start()
+    # Chat logs are parsed by a pool of processes, which needs support
+    # when frozen into an executable
+    freeze_support()
+    if len(sys.argv) > 1:
+        # Command line interface doesn't need wx, so GUI isn't imported
+        from core.cli import main
+        sys.exit(main())
+    else:
+        # Reports of how long startup, imports and charts take are logged
+        logging.basicConfig(format='%(message)s', level=logging.INFO)
+        from core.components.report import Report
+        startup_report = Report('Startup')
+        # Importing the GUI (and everything it uses) is most of the time
+        # taken to start, so it's measured to catch it getting slower
+        with startup_report.phase('import'):
+            from core.main import WhatStats
+        WhatStats(startup_report).start()
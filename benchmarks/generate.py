@@ -0,0 +1,190 @@
+import argparse
+import itertools
+import random
+from datetime import datetime, timedelta
+
+FIRST_NAMES = [
+    'Alice', 'Bob', 'Carol', 'Dan', 'Erin', 'Frank', 'Grace', 'Heidi',
+    'Ivan', 'Judy', 'Mallory', 'Niaj', 'Olivia', 'Peggy', 'Rupert',
+    'Sybil', 'Trent', 'Victor', 'Walter', 'Zoë',
+]
+SURNAMES = [
+    'Smith', 'Jones', 'Taylor', 'Brown', 'Williams', 'Wilson', 'Johnson',
+    'Davies', 'Robinson', 'Wright', 'Thompson', 'Evans', 'Walker', 'White',
+]
+WORDS = (
+    'the be to of and a in that have I it for not on with he as you do at '
+    'this but his by from they we say her she or an will my one all would '
+    'there their what so up out if about who get which go me when make can '
+    'like time no just him know take people into year your good some could '
+    'them see other than then now look only come its over think also back '
+    'after use two how our work first well way even new want because any '
+    'these give day most us lol haha ok yeah 😂 👍 tonight tomorrow pub '
+    'football dinner train late sorry thanks!'
+).split()
+# Media which wasn't exported is written in the form store.get_type
+# recognises, since content which starts with \u200e is taken to be a
+# notice on iOS
+MEDIA = [
+    '<‎image omitted>',
+    '<‎video omitted>',
+    '<‎GIF omitted>',
+    '<‎document omitted>',
+    '<‎audio omitted>',
+    '<‎sticker omitted>',
+    '<‎Contact card omitted>',
+    '<‎Location: https://maps.google.com/?q=51.5{:04},-0.1{:04}>',
+]
+# Types of attachments given as (iOS name, Android prefix, extension)
+ATTACHMENTS = [
+    ('PHOTO', 'IMG', 'jpg'),
+    ('VIDEO', 'VID', 'mp4'),
+    ('GIF', 'VID', 'mp4'),
+    ('AUDIO', 'PTT', 'opus'),
+    ('STICKER', 'STK', 'webp'),
+]
+
+TIMESTAMP_FORMAT = '%d/%m/%Y, %H:%M:%S'
+ANDROID_TIMESTAMP_FORMAT = '%d/%m/%Y, %H:%M'
+PLATFORMS = ['ios', 'android']
+
+
+def member_names(count, rng):
+    """Return list of count distinct member names."""
+    names = []
+    while len(names) < count:
+        name = '{} {}'.format(rng.choice(FIRST_NAMES), rng.choice(SURNAMES))
+        if len(names) % 7 == 6:
+            # Some members are only known by their phone number
+            name = '+44 7{:03} {:06}'.format(
+                rng.randrange(1000), rng.randrange(10**6))
+        if name in names:
+            name = '{} {}'.format(name, len(names))
+        names.append(name)
+    return names
+
+
+def text(rng):
+    """Return random text of a few words."""
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 25)))
+
+
+def attachment(number, timestamp, rng, android):
+    """
+    Return (name, content) of random attachment sent at timestamp, named
+    as it would be in a chat log zip exported with media.
+    """
+    ios_name, android_prefix, extension = rng.choice(ATTACHMENTS)
+    if android:
+        name = '{}-{}-WA{:04}.{}'.format(
+            android_prefix, timestamp.strftime('%Y%m%d'), number % 10**4,
+            extension)
+        return name, '{} (file attached)'.format(name)
+    name = '{:08}-{}-{}.{}'.format(
+        number, ios_name, timestamp.strftime('%Y-%m-%d-%H-%M-%S'), extension)
+    return name, '‎<attached: {}>'.format(name)
+
+
+def generate_chat_log(chat_log_obj, messages, members=10, seed=0,
+                      start=datetime(2015, 1, 1), platform='ios',
+                      attachments=False):
+    """
+    Write synthetic chat log, as exported from platform (ios/android), of
+    the given number of messages sent by the given number of members to
+    text file object. Chat logs generated with the same arguments are
+    identical. Return list of the names of the files attached to messages.
+
+    The chat log starts with an encryption notice and contains multi line
+    messages, media messages and subject changes. If attachments is True,
+    then half of the media messages are attachments, as if the chat log
+    was exported with media (whose files aren't written).
+    """
+    android = platform == 'android'
+    names_attached = []
+    rng = random.Random(seed)
+    names = member_names(members, rng)
+    # Some members are much more talkative than others
+    weights = list(itertools.accumulate(1 / (i + 1) for i in range(members)))
+    subject = 'Benchmark Chat'
+    timestamp = start
+
+    def line(body, prefix=''):
+        if android:
+            return '{} - {}\n'.format(
+                timestamp.strftime(ANDROID_TIMESTAMP_FORMAT), body)
+        return '{}[{}] {}\n'.format(
+            prefix, timestamp.strftime(TIMESTAMP_FORMAT), body)
+
+    if android:
+        lines = [
+            line('Messages and calls are end-to-end encrypted. No one '
+                 'outside of this chat, not even WhatsApp, can read or '
+                 'listen to them.'),
+            line('{} created group "{}"'.format(names[0], subject)),
+        ]
+    else:
+        lines = [line('{}: ‎Messages to this group are now secured with '
+                      'end-to-end encryption.'.format(subject))]
+    for i in range(messages):
+        timestamp += timedelta(seconds=int(rng.expovariate(1 / 600)))
+        sender = rng.choices(names, cum_weights=weights)[0]
+        kind = rng.random()
+        # Lines of attachments start with a \u200e character on iOS
+        prefix = ''
+        if kind < 0.001:
+            old_subject = subject
+            subject = 'Benchmark Chat {}'.format(i)
+            if android:
+                lines.append(line(
+                    '{} changed the subject from "{}" to "{}"'.format(
+                        sender, old_subject, subject)))
+            else:
+                lines.append(line('‎{} changed the subject to “{}”'.format(
+                    sender, subject)))
+            continue
+        elif kind < 0.04 and attachments:
+            name, content = attachment(
+                len(names_attached), timestamp, rng, android)
+            names_attached.append(name)
+            prefix = '‎'
+        elif kind < 0.08:
+            if android:
+                content = '<Media omitted>'
+            else:
+                content = rng.choice(MEDIA).format(
+                    rng.randrange(10**4), rng.randrange(10**4))
+        elif kind < 0.13:
+            content = '\n'.join(
+                text(rng) for _ in range(rng.randint(2, 6)))
+        else:
+            content = text(rng)
+        lines.append(line('{}: {}'.format(sender, content), prefix))
+
+        if len(lines) >= 10000:
+            chat_log_obj.writelines(lines)
+            lines = []
+    chat_log_obj.writelines(lines)
+    return names_attached
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate a synthetic WhatsApp chat log.')
+    parser.add_argument('path', help='path to write chat log to')
+    parser.add_argument('-n', '--messages', type=int, default=100000)
+    parser.add_argument('-m', '--members', type=int, default=10)
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('-p', '--platform', choices=PLATFORMS,
+                        default='ios')
+    parser.add_argument('-a', '--attachments', action='store_true',
+                        help='reference attachments as if the chat log was '
+                             'exported with media')
+    args = parser.parse_args()
+    with open(args.path, 'w', encoding='utf-8') as chat_log_obj:
+        generate_chat_log(chat_log_obj, args.messages, args.members,
+                          args.seed, platform=args.platform,
+                          attachments=args.attachments)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from zipfile import ZipFile
+
+import numpy as np
+
+from benchmarks.generate import PLATFORMS, generate_chat_log
+from core.components.archive import attachment_sizes, find_chat_log
+from core.components.cache import ChatCache
+from core.components.charts import (draw_bar_chart, draw_doughnut_chart,
+                                    render_chart)
+from core.components.chat import BACKENDS, Chat
+from core.components.data import (aggregate_data,
+                                  conversations_started_data,
+                                  media_volume_data, messages_sent_data,
+                                  most_used_words_data, replies_data,
+                                  reply_time_data, words_sent_data)
+
+# Modules which are imported when the program starts, whose import times
+# are measured so that startup getting slower is caught
+STARTUP_MODULES = ['core.main', 'core.cli', 'core.components.charts']
+# Script run in a new interpreter which prints how long importing a
+# module takes
+IMPORT_SCRIPT = '''
+import time
+start = time.perf_counter()
+import {}
+print(time.perf_counter() - start)
+'''
+ROOT = Path(__file__).resolve().parent.parent
+# Attachments are given random sizes of up to this many bytes, since their
+# files are empty so that the zip is quick to write
+MAX_ATTACHMENT_SIZE = 16 * 2**20
+
+
+def measure(function, memory):
+    """
+    Return (result, seconds, peak bytes) of calling function, where peak
+    bytes is the peak memory allocated by it (or None if memory is False).
+    """
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+class Benchmark:
+    """Runs phases of importing and analysing a chat log and records them."""
+
+    def __init__(self, repeat, memory):
+        self.repeat = repeat
+        self.memory = memory
+        self.results = []
+
+    def run(self, name, function, items, size=None):
+        """
+        Time function (taking the best of repeat runs) and record its
+        throughput in items (and bytes of size) per second. Return the
+        result of the last run.
+        """
+        times = []
+        for _ in range(self.repeat):
+            result, seconds, _ = measure(function, False)
+            times.append(seconds)
+        peak = None
+        if self.memory:
+            # Tracing memory slows down function, so it's run separately
+            result, _, peak = measure(function, True)
+        self.record(name, min(times), items, size, peak)
+        return result
+
+    def run_import(self, module):
+        """
+        Time importing module in a new interpreter (taking the best of
+        repeat runs), since it's only imported once in this one. Modules
+        which can't be imported (e.g. the GUI without wx) are skipped.
+        """
+        times = []
+        for _ in range(self.repeat):
+            process = subprocess.run(
+                [sys.executable, '-c', IMPORT_SCRIPT.format(module)],
+                cwd=str(ROOT), stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL, universal_newlines=True)
+            if process.returncode:
+                print('{:<32} skipped (can\'t be imported)'.format(
+                    'import ' + module))
+                return
+            times.append(float(process.stdout))
+        self.record('import ' + module, min(times), 1)
+
+    def record(self, name, seconds, items, size=None, peak=None):
+        """Record and print result of phase."""
+        self.results.append({
+            'phase': name,
+            'seconds': seconds,
+            'items': items,
+            'items_per_second': items / seconds if seconds else None,
+            'megabytes_per_second': (
+                size / 2**20 / seconds if size and seconds else None),
+            'peak_bytes': peak,
+        })
+        print('{:<32} {:>10.4f} s {:>14,.0f} items/s {:>10} peak'.format(
+            name, seconds, items / seconds if seconds else 0,
+            '-' if peak is None else '{:,.1f} MB'.format(peak / 2**20)))
+
+
+def run_benchmarks(args, directory):
+    """Return list of results of benchmarks run in directory."""
+    chat_log_path = directory / '_chat.txt'
+    start = time.perf_counter()
+    with chat_log_path.open('w', encoding='utf-8') as chat_log_obj:
+        names = generate_chat_log(
+            chat_log_obj, args.messages, args.members, args.seed,
+            platform=args.platform, attachments=args.attachments)
+    size = chat_log_path.stat().st_size
+    print('Generated {:,} messages ({:,.1f} MB) in {:.1f} s\n'.format(
+        args.messages, size / 2**20, time.perf_counter() - start))
+
+    benchmark = Benchmark(args.repeat, args.memory)
+    for module in STARTUP_MODULES:
+        benchmark.run_import(module)
+
+    def load():
+        chat = Chat(chat_log_path)
+        chat.load_messages(workers=args.workers, backend=args.backend)
+        return chat
+
+    # Validation and subject search happen in the same pass as parsing
+    chat = benchmark.run('load_messages', load, args.messages, size)
+    messages = len(chat.messages)
+
+    cache = ChatCache(directory / 'cache', max_size=float('inf'))
+    benchmark.run('cache save', lambda: cache.save('chat', chat), messages)
+    benchmark.run('cache load', lambda: cache.load('chat'), messages)
+
+    start_date = chat.start_date
+    end_date = chat.end_date
+    if names:
+        zip_path = directory / 'chat.zip'
+        with ZipFile(str(zip_path), 'w') as zip_obj:
+            zip_obj.write(str(chat_log_path), chat_log_path.name)
+            for name in names:
+                zip_obj.writestr(name, b'')
+
+        def read_sizes():
+            with ZipFile(str(zip_path)) as zip_obj:
+                return attachment_sizes(zip_obj, find_chat_log(zip_obj))
+
+        sizes = benchmark.run('attachment_sizes', read_sizes, len(names))
+        rng = np.random.RandomState(args.seed)
+        chat.attachment_sizes = dict(zip(
+            sizes, rng.randint(MAX_ATTACHMENT_SIZE, size=len(sizes))))
+
+        def build_media_index():
+            chat._media = None
+            return chat.media
+
+        benchmark.run('media index', build_media_index, messages)
+        benchmark.run(
+            'media_volume_data',
+            lambda: media_volume_data(chat, start_date, end_date), messages)
+    benchmark.run(
+        'messages_sent_data',
+        lambda: messages_sent_data(chat, start_date, end_date), messages)
+    benchmark.run(
+        'words_sent_data',
+        lambda: words_sent_data(chat, start_date, end_date), messages)
+    benchmark.run(
+        'aggregate_data',
+        lambda: aggregate_data(chat, start_date, end_date), messages)
+    benchmark.run(
+        'most_used_words_data', lambda: most_used_words_data(chat), messages)
+    for statistic in [reply_time_data, replies_data,
+                      conversations_started_data]:
+        benchmark.run(
+            statistic.__name__,
+            lambda: statistic(chat, start_date, end_date), messages)
+
+    data = messages_sent_data(chat, start_date, end_date)
+    for name, draw_chart in [('bar chart', draw_bar_chart),
+                             ('doughnut chart', draw_doughnut_chart)]:
+        benchmark.run(
+            name, lambda: render_chart(draw_chart, data, 'Benchmark'),
+            len(data[0]))
+    return benchmark.results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark importing and analysing a synthetic chat '
+                    'log, saving the results as JSON.')
+    parser.add_argument('-n', '--messages', type=int, default=100000,
+                        help='number of messages (e.g. 10000 to 10000000)')
+    parser.add_argument('-m', '--members', type=int, default=10)
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('-p', '--platform', choices=PLATFORMS,
+                        default='ios',
+                        help='platform which chat log is exported from')
+    parser.add_argument('-a', '--attachments', action='store_true',
+                        help='reference attachments in chat log and '
+                             'benchmark media statistics')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of processes to parse chat log with')
+    parser.add_argument('-b', '--backend', choices=BACKENDS, default=None,
+                        help='how chat log is parsed (defaults to buffer)')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='number of times to time each phase')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='don\'t measure peak memory of each phase')
+    parser.add_argument('-o', '--output', type=Path,
+                        default=Path('benchmark.json'),
+                        help='path to save results to')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = run_benchmarks(args, Path(directory))
+
+    with args.output.open('w', encoding='utf-8') as output_obj:
+        json.dump({
+            'date': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'arguments': {
+                'messages': args.messages,
+                'members': args.members,
+                'seed': args.seed,
+                'platform': args.platform,
+                'attachments': args.attachments,
+                'workers': args.workers,
+                'backend': args.backend,
+                'repeat': args.repeat,
+            },
+            'results': results,
+        }, output_obj, indent=2)
+    print('\nSaved results to {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+import argparse
+import csv
+import json
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from hashlib import sha1
+from pathlib import Path
+from zipfile import BadZipFile
+
+from .components.archive import load_chat
+from .components.cache import ChatCache
+from .components.charts import (chart_title, draw_bar_chart,
+                                draw_doughnut_chart, render_chart)
+from .components.chat import BACKENDS
+from .components.data import aggregate_data
+from .components.formats import FORMATS
+from .components.report import Report
+
+STATISTICS = {
+    'messages': 'Messages sent',
+    'words': 'Words sent',
+    'characters': 'Characters sent',
+    'text': 'Texts sent',
+    'image': 'Images sent',
+    'video': 'Videos sent',
+    'gif': 'GIFs sent',
+    'document': 'Documents sent',
+    'location': 'Locations sent',
+    'contact': 'Contacts sent',
+}
+CHART_STYLES = {
+    'doughnut': draw_doughnut_chart,
+    'bar': draw_bar_chart,
+}
+
+
+def parse_date(value):
+    """Return date given as dd/mm/yyyy."""
+    try:
+        return datetime.strptime(value, '%d/%m/%Y').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'invalid date {!r}, expected dd/mm/yyyy'.format(value))
+
+
+def parse_args(args):
+    """Return namespace of command line arguments."""
+    parser = argparse.ArgumentParser(
+        prog='WhatStats',
+        description='Generate statistics from WhatsApp chat log zips.')
+    parser.add_argument('zip_paths', nargs='+', type=Path, metavar='zip',
+                        help='chat log zip exported from WhatsApp')
+    parser.add_argument('-o', '--output', type=Path, default=Path('.'),
+                        help='directory to write results to')
+    parser.add_argument('-f', '--format', choices=['json', 'csv'],
+                        default='json', help='format of results')
+    parser.add_argument('--start', type=parse_date,
+                        help='start date (dd/mm/yyyy), defaults to the '
+                             'date of the first message')
+    parser.add_argument('--end', type=parse_date,
+                        help='end date (dd/mm/yyyy), defaults to the '
+                             'date of the last message')
+    parser.add_argument('--chart', choices=['png', 'svg'],
+                        help='also render a chart of each statistic')
+    parser.add_argument('--chart-style', choices=list(CHART_STYLES),
+                        default='doughnut', help='style of charts')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of chats to process at once '
+                             '(defaults to number of CPUs)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='don\'t load or save parsed chats in cache')
+    parser.add_argument('--backend', choices=BACKENDS,
+                        help='how chat logs are parsed: line by line as '
+                             'they\'re extracted (the default) or from a '
+                             'buffer of the whole chat log')
+    parser.add_argument('--log-format', choices=list(FORMATS),
+                        help='format of chat logs, found from the start of '
+                             'each chat log by default')
+    parser.add_argument('--report', type=Path,
+                        help='append a JSON report of how long each phase '
+                             'of processing each chat took to this file')
+    return parser.parse_args(args)
+
+
+def write_results(path, results, format):
+    """Write results of chat to path in format (json/csv)."""
+    if format == 'json':
+        with path.open('w', encoding='utf-8') as results_obj:
+            json.dump(results, results_obj, ensure_ascii=False, indent=2)
+    else:
+        with path.open('w', encoding='utf-8', newline='') as results_obj:
+            writer = csv.writer(results_obj)
+            writer.writerow(['statistic', 'member', 'count'])
+            for statistic, data in results['statistics'].items():
+                for member, count in zip(data['members'], data['counts']):
+                    writer.writerow([statistic, member, count])
+
+
+def output_names(zip_paths):
+    """
+    Return the name which the results of each zip are written under: the
+    name of the zip, followed by a hash of its path if another zip has the
+    same name, so that neither's results overwrite the other's.
+    """
+    counts = Counter(zip_path.stem for zip_path in zip_paths)
+    names = []
+    for zip_path in zip_paths:
+        name = zip_path.stem
+        if counts[name] > 1:
+            path = str(zip_path.resolve()).encode('utf-8')
+            name = '{} ({})'.format(name, sha1(path).hexdigest()[:8])
+        names.append(name)
+    return names
+
+
+def process_zip(zip_path, args, name=None):
+    """
+    Generate statistics for chat log zip and write them (and charts) to
+    output directory under name (the name of the zip by default). Return
+    (list of paths written, report of how long each phase took).
+    """
+    name = name or zip_path.stem
+    report = Report('Process {}'.format(zip_path.name))
+    cache = None if args.no_cache else ChatCache()
+    # Chats are already processed in parallel, so each is parsed in a
+    # single process
+    chat = load_chat(zip_path, cache, workers=1, report=report,
+                     backend=args.backend, log_format=args.log_format)
+    start_date = args.start or chat.start_date
+    end_date = args.end or chat.end_date
+    with report.phase('statistics', len(chat.messages)):
+        statistics = {
+            STATISTICS[metric]: data
+            for metric, data in aggregate_data(
+                chat, start_date, end_date, list(STATISTICS)).items()
+        }
+
+    results = {
+        'zip': str(zip_path),
+        'subject': chat.subject,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'statistics': {
+            statistic: {'members': members, 'counts': counts}
+            for statistic, (members, counts) in statistics.items()
+        },
+    }
+    results_path = args.output / '{}.{}'.format(name, args.format)
+    write_results(results_path, results, args.format)
+    paths = [results_path]
+
+    if args.chart is not None:
+        draw_chart = CHART_STYLES[args.chart_style]
+        with report.phase('chart rendering') as phase:
+            for statistic, data in statistics.items():
+                if not data[0]:
+                    continue
+                title = chart_title(statistic, chat, start_date, end_date)
+                chart_path = args.output / '{} - {}.{}'.format(
+                    name, statistic, args.chart)
+                chart_path.write_bytes(
+                    render_chart(draw_chart, data, title, args.chart))
+                paths.append(chart_path)
+            phase['items'] = len(paths) - 1
+    return paths, report
+
+
+def main(args=None):
+    """Run command line interface, returning exit status."""
+    args = parse_args(sys.argv[1:] if args is None else args)
+    args.output.mkdir(parents=True, exist_ok=True)
+    status = 0
+    # A zip given more than once would be written by two processes at once
+    zip_paths = list({
+        zip_path.resolve(): zip_path for zip_path in args.zip_paths
+    }.values())
+    with ProcessPoolExecutor(args.jobs) as executor:
+        futures = [
+            (zip_path, executor.submit(process_zip, zip_path, args, name))
+            for zip_path, name in zip(zip_paths, output_names(zip_paths))
+        ]
+        for zip_path, future in futures:
+            try:
+                paths, report = future.result()
+            except (OSError, BadZipFile):
+                error = 'Couldn\'t open zip file.'
+            except KeyError:
+                error = 'Couldn\'t extract chat log.'
+            except ValueError:
+                error = 'Chat log not valid.'
+            except Exception as exception:
+                # Any other error (e.g. an encrypted zip) only fails the zip
+                # it was raised for
+                error = 'Couldn\'t process zip file ({}: {}).'.format(
+                    type(exception).__name__, exception)
+            else:
+                for path in paths:
+                    print(path)
+                if args.report is not None:
+                    report.dump(args.report)
+                continue
+            print('{}: {}'.format(zip_path, error), file=sys.stderr)
+            status = 1
+    return status
@@ -0,0 +1,135 @@
+import itertools
+from pathlib import PurePosixPath
+from zipfile import ZipFile
+
+from .cache import chat_key
+from .chat import Chat, text_hash
+from .report import record_phase
+
+# Chat logs exported from iOS are always given this name, whereas ones
+# exported from Android are named after the chat
+CHAT_LOG_NAME = '_chat.txt'
+ANDROID_CHAT_LOG_PREFIX = 'WhatsApp Chat'
+
+
+def find_chat_log(zip_obj):
+    """
+    Return info (zipfile.ZipInfo) of chat log in chat log zip file object.
+    Raises KeyError if it doesn't contain one.
+    """
+    try:
+        return zip_obj.getinfo(CHAT_LOG_NAME)
+    except KeyError:
+        pass
+    text_infos = [info for info in zip_obj.infolist()
+                  if info.filename.endswith('.txt')
+                  and '/' not in info.filename]
+    chat_log_infos = [info for info in text_infos
+                      if info.filename.startswith(ANDROID_CHAT_LOG_PREFIX)]
+    # Otherwise, the only text file is taken to be the chat log
+    for infos in [chat_log_infos, text_infos]:
+        if len(infos) == 1:
+            return infos[0]
+    raise KeyError('There is no chat log in the zip file.')
+
+
+def attachment_sizes(zip_obj, chat_log_info):
+    """
+    Return dict of the size in bytes of each file (other than the chat log)
+    in chat log zip file object by name. The sizes are read from the
+    zip's central directory, so the attachments are never decompressed.
+    """
+    return {
+        PurePosixPath(info.filename).name: info.file_size
+        for info in zip_obj.infolist()
+        if info is not chat_log_info and not info.is_dir()
+    }
+
+
+def load_chat(zip_path, cache=None, progress=None, workers=None, chat=None,
+              report=None, backend=None, log_format=None):
+    """
+    Return chat loaded from chat log in chat log zip, which is streamed
+    out of the zip file rather than extracted.
+
+    If cache is given, then chat is loaded from it if it's been imported
+    before, otherwise it's added to it. If chat (or a chat in cache) is
+    an earlier export of the chat log, then only the messages which have
+    been sent since are parsed and added to it. Either way, the sizes of
+    the attachments in the zip are set as the chat's attachment sizes
+    (see attachment_sizes).
+
+    Raises OSError/zipfile.BadZipFile if zip file can't be opened,
+    KeyError if it doesn't contain a chat log and ValueError if chat log
+    is not valid.
+
+    Optional Arguments:
+    cache - cache of parsed chats (cache.ChatCache)
+    progress, workers, report, backend - see Chat.load_messages
+    chat - chat which chat log may be a later export of (which is left
+           unchanged, see Chat.copy)
+    log_format - see Chat
+    """
+
+    def same_format(chat):
+        return log_format is None or chat.log_format.name == log_format
+
+    with open(str(zip_path), 'rb') as zip_file_obj:
+        with record_phase(report, 'open zip'):
+            zip_obj = ZipFile(zip_file_obj)
+        with zip_obj:
+            chat_log_info = find_chat_log(zip_obj)
+            key = chat_key(chat_log_info)
+            sizes = attachment_sizes(zip_obj, chat_log_info)
+            if cache is not None:
+                with zip_obj.open(chat_log_info) as chat_log_obj:
+                    first_line = chat_log_obj.readline()
+                first_line_hash = text_hash(
+                    first_line.decode('utf-8', 'replace').rstrip('\r\n'))
+                with record_phase(report, 'cache load') as phase:
+                    cached_chat = cache.load(key)
+                    if cached_chat is not None:
+                        phase['items'] = len(cached_chat.store)
+                # The key is only a checksum of the chat log, so the first
+                # line is checked too before the cached chat is trusted
+                if (cached_chat is not None and same_format(cached_chat)
+                        and cached_chat.first_line_hash == first_line_hash):
+                    cached_chat.attachment_sizes = sizes
+                    cached_chat.cache_key = key
+                    return cached_chat
+
+            def compressed_position():
+                # The zip file is read sequentially from the start of
+                # the chat log as it's decompressed
+                return zip_file_obj.tell() - chat_log_info.header_offset
+
+            size = chat_log_info.compress_size
+            # Messages are added to a copy of the given chat, since it may
+            # still be in use on other threads
+            earlier_chats = [chat.copy()] if chat is not None else []
+            if cache is not None:
+                earlier_chats = itertools.chain(
+                    earlier_chats, cache.find(first_line_hash))
+            for earlier_chat in filter(same_format, earlier_chats):
+                with zip_obj.open(chat_log_info) as chat_log_obj:
+                    if earlier_chat.load_new_messages(
+                            chat_log_obj, progress, size, compressed_position,
+                            report):
+                        chat = earlier_chat
+                        break
+            else:
+                with zip_obj.open(chat_log_info) as chat_log_obj:
+                    chat = Chat(chat_log_obj, size, compressed_position,
+                                log_format, chat_log_info.file_size)
+                    # The chat log is decompressed as it's parsed, so zip
+                    # extraction is part of the parse phase
+                    chat.load_messages(progress, workers, report, backend)
+            chat.attachment_sizes = sizes
+            chat.cache_key = key
+
+    cancelled = progress is not None and progress.is_cancelled()
+    if cache is not None and not cancelled:
+        with record_phase(report, 'cache save') as phase:
+            cache.save(key, chat)
+            phase['items'] = len(chat.store)
+    return chat
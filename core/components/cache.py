@@ -0,0 +1,282 @@
+import json
+import mmap
+import os
+import struct
+import threading
+from hashlib import sha1
+from pathlib import Path
+
+import numpy as np
+
+from .chat import Chat
+from .stats import prefix_sum
+from .words import Vocabulary
+
+CACHE_PATH = Path.home() / '.whatstats' / 'cache'
+CACHE_SIZE = 512 * 2**20
+CACHE_SUFFIX = '.chat'
+WORDS_SUFFIX = '.words'
+
+# Increment whenever the parser or the cache format changes, so that
+# chats cached by an older version are parsed again rather than misread
+FORMAT_VERSION = 6
+
+# Cache files start with magic bytes, format version and the length of a
+# JSON header which gives the dtype, length and offset of each array.
+# Vocabularies are saved in a file of their own next to each entry, so
+# that headers stay small enough for find to read them all
+MAGIC = b'WHATSTAT'
+PREAMBLE = struct.Struct('<8sII')
+ALIGNMENT = 8
+COLUMNS = ['timestamps', 'senders', 'type_ids', 'word_counts']
+FINGERPRINT = ['subject_fixed', 'first_line_hash', 'last_message_offset',
+               'last_message_size', 'last_message_hash']
+
+
+def chat_key(zip_info):
+    """
+    Return cache key of the chat log described by zip info
+    (zipfile.ZipInfo), which is a hash of its CRC and size.
+    """
+    entry = '{}:{}'.format(zip_info.CRC, zip_info.file_size)
+    return sha1(entry.encode()).hexdigest()
+
+
+def aligned(offset):
+    """Return offset rounded up to a multiple of ALIGNMENT."""
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+class ChatCache:
+    """
+    Size bounded cache of parsed chats on disk, which evicts the least
+    recently used chats first.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_size=CACHE_SIZE):
+        self.path = Path(path)
+        self.max_size = max_size
+
+    def entry_path(self, key):
+        """Return path of cache entry with key."""
+        return self.path / (key + CACHE_SUFFIX)
+
+    def words_path(self, key):
+        """Return path of vocabulary saved with cache entry with key."""
+        return self.path / (key + WORDS_SUFFIX)
+
+    def load(self, key):
+        """Return chat cached with key, or None if it's not cached."""
+        entry_path = self.entry_path(key)
+        if not entry_path.exists():
+            return None
+        try:
+            with entry_path.open('rb') as entry_obj:
+                buffer = mmap.mmap(
+                    entry_obj.fileno(), 0, access=mmap.ACCESS_READ)
+            chat = self.read_chat(buffer)
+            if chat is not None:
+                vocabulary = self.read_vocabulary(key)
+                if (vocabulary is not None
+                        and vocabulary.size <= len(chat.store)):
+                    chat.vocabulary = vocabulary
+                # Modification time records when entry was last used
+                os.utime(str(entry_path))
+                return chat
+        except (OSError, ValueError, KeyError, struct.error):
+            pass
+        self.remove(entry_path)
+        self.remove(self.words_path(key))
+        return None
+
+    def read_vocabulary(self, key):
+        """
+        Return vocabulary saved with cache entry with key, or None if it
+        hasn't been saved.
+        """
+        try:
+            words_path = self.words_path(key)
+            return Vocabulary.from_dict(
+                json.loads(words_path.read_text(encoding='utf-8')))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def find(self, first_line_hash):
+        """
+        Return iterator which iterates over the cached chats whose chat
+        log's first line has first line hash, most recently used first.
+        These may be earlier exports of the same chat (see
+        Chat.load_new_messages).
+        """
+        entries = sorted(self.path.glob('*' + CACHE_SUFFIX),
+                         key=self.last_used, reverse=True)
+        for entry_path in entries:
+            try:
+                with entry_path.open('rb') as entry_obj:
+                    preamble = entry_obj.read(PREAMBLE.size)
+                    _, _, header_size = PREAMBLE.unpack(preamble)
+                    header = self.read_header(
+                        preamble + entry_obj.read(header_size))
+            except (OSError, ValueError, struct.error):
+                continue
+            if (header is not None
+                    and header['first_line_hash'] == first_line_hash):
+                chat = self.load(entry_path.stem)
+                if chat is not None:
+                    yield chat
+
+    def last_used(self, entry_path):
+        """Return time entry was last used (or 0 if it's missing)."""
+        try:
+            return entry_path.stat().st_mtime
+        except OSError:
+            return 0
+
+    def read_header(self, buffer):
+        """
+        Return header of cache entry buffer, or None if it was written
+        by a different version.
+        """
+        magic, version, header_size = PREAMBLE.unpack_from(buffer)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            return None
+        start = PREAMBLE.size
+        return json.loads(bytes(buffer[start:start + header_size]))
+
+    def read_chat(self, buffer):
+        """
+        Return chat read from cache entry buffer, or None if it was
+        written by a different version.
+        """
+        header = self.read_header(buffer)
+        if header is None:
+            return None
+        _, _, header_size = PREAMBLE.unpack_from(buffer)
+        data_start = aligned(PREAMBLE.size + header_size)
+
+        arrays = {}
+        for name, (dtype, count, offset) in header['arrays'].items():
+            arrays[name] = np.frombuffer(
+                buffer, dtype, count, data_start + offset)
+
+        chat = Chat(log_format=header['log_format'])
+        chat.subject = header['subject']
+        for attribute in FINGERPRINT:
+            setattr(chat, attribute, header[attribute])
+        for name in header['members']:
+            chat.members.add(name)
+        store = chat.store
+        for message_type in header['types']:
+            store.type_code(message_type)
+        for column in COLUMNS:
+            setattr(store, column, arrays[column])
+        # Contents are left in the memory mapped entry until they're read
+        offsets = arrays['content_offsets']
+        store.contents.attach(
+            memoryview(arrays['contents']), offsets[:-1], offsets[1:])
+        chat.finish_loading()
+        return chat
+
+    def save(self, key, chat):
+        """Cache chat with key, evicting old chats if cache is full."""
+        store = chat.store
+        spans = store.contents
+        # Type codes and word counts are only saved as far as they've been
+        # found, rather than being found for every message (see
+        # MessageStore), and are found for the rest once they're loaded
+        arrays = {
+            'timestamps': store.timestamps,
+            'senders': store.senders,
+            'type_ids': store._type_ids,
+            'word_counts': store._word_counts,
+        }
+        arrays['content_offsets'] = prefix_sum(spans.ends - spans.starts)
+
+        layout = {}
+        offset = 0
+        for name, array in arrays.items():
+            layout[name] = [array.dtype.str, len(array), offset]
+            offset = aligned(offset + array.nbytes)
+        # Contents are written straight from the buffers they're spans of
+        # (see ContentColumn.write), so they're never all copied at once
+        layout['contents'] = [
+            np.dtype(np.uint8).str, int(arrays['content_offsets'][-1]),
+            offset]
+        header = {
+            'log_format': chat.log_format.name,
+            'subject': chat.subject,
+            'members': [member.sender for member in chat.members],
+            'types': store.types,
+            'arrays': layout,
+        }
+        for attribute in FINGERPRINT:
+            header[attribute] = getattr(chat, attribute)
+        header = json.dumps(header).encode('utf-8')
+        data_start = aligned(PREAMBLE.size + len(header))
+
+        # Entry is written to a temporary file first so that a partly
+        # written entry is never loaded (even by another process)
+        entry_path = self.entry_path(key)
+        temp_path = entry_path.with_suffix('.{}.tmp'.format(os.getpid()))
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            with temp_path.open('wb') as entry_obj:
+                entry_obj.write(
+                    PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+                entry_obj.write(header)
+                for name, array in arrays.items():
+                    entry_obj.seek(data_start + layout[name][2])
+                    entry_obj.write(np.ascontiguousarray(array))
+                entry_obj.seek(data_start + layout['contents'][2])
+                spans.write(entry_obj)
+            os.replace(str(temp_path), str(entry_path))
+        except OSError:
+            self.remove(temp_path)
+            return
+        self.save_vocabulary(key, chat)
+        self.evict()
+
+    def save_vocabulary(self, key, chat):
+        """
+        Save vocabulary of chat cached with key, which may have been
+        counted since the chat was cached (see Chat.count_words).
+        """
+        if not self.entry_path(key).exists():
+            return
+        words_path = self.words_path(key)
+        with chat.store.lock:
+            if not chat.vocabulary.size:
+                self.remove(words_path)
+                return
+            vocabulary = json.dumps(chat.vocabulary.as_dict())
+        # Vocabulary may be saved by more than one thread at once
+        temp_path = words_path.with_suffix('.{}.{}.tmp'.format(
+            os.getpid(), threading.get_ident()))
+        try:
+            temp_path.write_text(vocabulary, encoding='utf-8')
+            os.replace(str(temp_path), str(words_path))
+        except OSError:
+            self.remove(temp_path)
+
+    def evict(self):
+        """Remove least recently used entries until cache isn't full."""
+        entries = []
+        for entry_path in self.path.glob('*' + CACHE_SUFFIX):
+            try:
+                entries.append((entry_path.stat(), entry_path))
+            except OSError:
+                pass
+        entries.sort(key=lambda entry: entry[0].st_mtime, reverse=True)
+        size = 0
+        for stat, entry_path in entries:
+            size += stat.st_size
+            if size > self.max_size:
+                self.remove(entry_path)
+                self.remove(self.words_path(entry_path.stem))
+
+    def remove(self, entry_path):
+        """Remove cache entry, ignoring errors (e.g. if it's in use)."""
+        try:
+            entry_path.unlink()
+        except OSError:
+            pass
@@ -1,8 +1,10 @@
+from io import BytesIO
 from random import randrange
 
-from matplotlib import use
-use('WXAgg')
-from matplotlib import pyplot as plot
+import numpy as np
+
+# matplotlib takes a while to import, so it's only imported once a chart
+# is first drawn (see pyplot) rather than when the program starts
 
 COLOUR_PALETTE = [
     '#cee8eb',  # Jagged Ice
@@ -30,6 +32,15 @@ COLOUR_PALETTE = [
     '#4b9dd1',  # Shakespeare
     '#2093a3',  # Eastern Blue
 ]
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+# Charts only show this many members (or words) on their own and the rest
+# together as Others, so that charts of large groups are quick to draw and
+# can still be read
+TOP_MEMBERS = 20
+OTHERS_LABEL = 'Others'
+# Most charts which are left open at once, after which the oldest are
+# closed so that figures don't pile up in memory
+MAX_FIGURES = 8
 
 
 def colour_list(n):
@@ -43,48 +54,263 @@ def colour_list(n):
     return colour_list
 
 
+def group_others(data, top=TOP_MEMBERS):
+    """
+    Return data tuple (labels, values), sorted by value, with every value
+    after the top ones added together and labelled Others (unless top is
+    None or there aren't at least two of them).
+    """
+    labels, values = data
+    if top is None or len(labels) <= top + 1:
+        return data
+    return ([*labels[:top], OTHERS_LABEL], [*values[:top], sum(values[top:])])
+
+
+def group_other_series(series, top=TOP_MEMBERS):
+    """
+    Return list of (label, values) pairs, sorted by total, with the values
+    of every pair after the top ones added together and labelled Others
+    (unless top is None or there aren't at least two of them).
+    """
+    if top is None or len(series) <= top + 1:
+        return series
+    others = np.sum([values for _, values in series[top:]], axis=0)
+    return [*series[:top], (OTHERS_LABEL, others.tolist())]
+
+
+def group_other_matrix(data, top=TOP_MEMBERS):
+    """
+    Return data tuple (labels, rows), sorted by total, with every row and
+    column after the top ones added together and labelled Others (unless
+    top is None or there aren't at least two of them).
+    """
+    labels, rows = data
+    if top is None or len(labels) <= top + 1:
+        return data
+    matrix = np.array(rows)
+    grouped = np.zeros((top + 1, top + 1), dtype=matrix.dtype)
+    grouped[:top, :top] = matrix[:top, :top]
+    grouped[:top, top] = matrix[:top, top:].sum(axis=1)
+    grouped[top, :top] = matrix[top:, :top].sum(axis=0)
+    grouped[top, top] = matrix[top:, top:].sum()
+    return [*labels[:top], OTHERS_LABEL], grouped.tolist()
+
+
 def chart_title(statistic, chat, start_date, end_date):
     """Return title for chart displaying statistic (given as string)."""
     return '{statistic} in "{subject}" ({start_date} - {end_date})'.format(
         statistic=statistic,
         subject=chat.subject,
-        start_date=start_date.Format('%d/%m/%Y'),
-        end_date=end_date.Format('%d/%m/%Y'))
+        start_date=start_date.strftime('%d/%m/%Y'),
+        end_date=end_date.strftime('%d/%m/%Y'))
 
 
-def bar_chart(data, title):
-    """Show bar chart of data tuple (labels, values)."""
-    labels = data[0]
-    values = data[1]
+def pyplot():
+    """Return pyplot module, using the WXAgg backend to show charts."""
+    # Imported when first needed so that charts can be drawn without wx
+    import matplotlib
+    matplotlib.use('WXAgg')
+    from matplotlib import pyplot
+    return pyplot
+
+
+def draw_bar_chart(figure, data, title, top=TOP_MEMBERS):
+    """
+    Draw bar chart of data tuple (labels, values) on figure, with a bar
+    for each of the top labels and one for the rest (see group_others).
+    """
+    labels, values = group_others(data, top)
     index = [i for i in range(len(labels))]
     colours = colour_list(len(labels))
 
-    plot.figure('WhatStats - {title}'.format(title=title))
-    plot.title(title, y=1.08)
-    plot.bar(index, values, color=colours)
-    plot.xticks(index, labels, rotation=30)
+    axes = figure.add_subplot(1, 1, 1)
+    axes.set_title(title, y=1.08)
+    axes.bar(index, values, color=colours)
+    axes.set_xticks(index)
+    axes.set_xticklabels(labels, rotation=30)
     for i in index:
         value = '{:,}'.format(values[i])
-        plot.text(i, values[i], value, horizontalalignment='center')
+        axes.text(i, values[i], value, horizontalalignment='center')
 
-    plot.box(on=False)
-    plot.tight_layout()
-    plot.show()
+    axes.set_frame_on(False)
+    figure.tight_layout()
 
 
-def doughnut_chart(data, title):
-    """Show doughnut chart of data tuple (labels, values)."""
-    labels = data[0]
-    values = data[1]
+def draw_media_chart(figure, data, title, top=TOP_MEMBERS):
+    """
+    Draw stacked bar chart of data tuple (labels, [(label, sizes, counts),
+    ...]) on figure, with a bar for each of the top labels and one for the
+    rest (see group_others), split into the sizes in bytes (shown in
+    megabytes) of each series.
+    """
+    labels, series = data
+    sizes = [np.array(group_others((labels, sizes), top)[1]) / 2**20
+             for _, sizes, _ in series]
+    totals = np.sum(sizes, axis=0) if sizes else np.zeros(0)
+    labels, _ = group_others((labels, [0] * len(labels)), top)
+    index = [i for i in range(len(labels))]
+    colours = colour_list(len(series))
+
+    axes = figure.add_subplot(1, 1, 1)
+    axes.set_title(title, y=1.08)
+    bottom = np.zeros(len(labels))
+    for (label, _, counts), values, colour in zip(series, sizes, colours):
+        axes.bar(index, values, bottom=bottom, color=colour,
+                 label='{} ({:,})'.format(label, sum(counts)))
+        bottom += values
+    axes.set_xticks(index)
+    axes.set_xticklabels(labels, rotation=30)
+    for i in index:
+        value = '{:,.1f}'.format(totals[i])
+        axes.text(i, totals[i], value, horizontalalignment='center')
+    if series:
+        axes.legend(frameon=False)
+
+    axes.set_frame_on(False)
+    figure.tight_layout()
+
+
+def draw_doughnut_chart(figure, data, title, top=TOP_MEMBERS):
+    """
+    Draw doughnut chart of data tuple (labels, values) on figure, with a
+    slice for each of the top labels and one for the rest (see
+    group_others).
+    """
+    labels, values = group_others(data, top)
     slice_labels = ['{} ({:,})'.format(l, v) for l, v in zip(labels, values)]
     colours = colour_list(len(labels))
     explode = [0.05 for _ in range(len(labels))]
 
-    plot.figure('WhatStats - {title}'.format(title=title))
-    plot.title(title, y=1.08)
-    plot.pie(values, labels=slice_labels, colors=colours, explode=explode)
-    plot.gcf().gca().add_artist(plot.Circle((0, 0), 0.70, fc='white'))
+    axes = figure.add_subplot(1, 1, 1)
+    axes.set_title(title, y=1.08)
+    axes.pie(values, labels=slice_labels, colors=colours, explode=explode)
+    from matplotlib.patches import Circle
+    axes.add_artist(Circle((0, 0), 0.70, fc='white'))
+
+    axes.axis('equal')
+    figure.tight_layout()
+
+
+def draw_line_chart(figure, data, title, top=TOP_MEMBERS):
+    """
+    Draw line chart of data tuple (dates, [(label, values), ...]) on
+    figure, with a line for each of the top labels and one for the rest
+    (see group_other_series).
+    """
+    dates = data[0]
+    series = group_other_series(data[1], top)
+    colours = colour_list(len(series))
+
+    axes = figure.add_subplot(1, 1, 1)
+    axes.set_title(title, y=1.08)
+    for (label, values), colour in zip(series, colours):
+        axes.plot(dates, values, label=label, color=colour)
+    axes.legend(frameon=False)
+
+    axes.set_frame_on(False)
+    figure.autofmt_xdate()
+    figure.tight_layout()
 
-    plot.axis('equal')
-    plot.tight_layout()
+
+def draw_heatmap(figure, data, title):
+    """
+    Draw heatmap of data (rows of values for each hour of each day of the
+    week, starting on Monday) on figure.
+    """
+    axes = figure.add_subplot(1, 1, 1)
+    axes.set_title(title, y=1.08)
+    image = axes.imshow(data, aspect='auto', cmap='YlGnBu')
+    axes.set_yticks(range(len(WEEKDAYS)))
+    axes.set_yticklabels(WEEKDAYS)
+    axes.set_xticks(range(0, 24, 3))
+    axes.set_xticklabels(['{:02}:00'.format(hour) for hour in range(0, 24, 3)])
+    figure.colorbar(image, ax=axes)
+
+    axes.set_frame_on(False)
+    figure.tight_layout()
+
+
+def draw_reply_matrix(figure, data, title, top=TOP_MEMBERS):
+    """
+    Draw heatmap of data tuple (labels, rows) on figure, where rows are
+    lists of the number of times each member replied to each member, with
+    a row and column for each of the top members and one for the rest
+    (see group_other_matrix).
+    """
+    labels, rows = group_other_matrix(data, top)
+    axes = figure.add_subplot(1, 1, 1)
+    axes.set_title(title, y=1.08)
+    if labels:
+        image = axes.imshow(rows, aspect='auto', cmap='YlGnBu')
+        figure.colorbar(image, ax=axes)
+    ticks = range(len(labels))
+    axes.set_xticks(ticks)
+    axes.set_xticklabels(labels, rotation=30, horizontalalignment='right')
+    axes.set_yticks(ticks)
+    axes.set_yticklabels(labels)
+    axes.set_xlabel('Replied to')
+    axes.set_ylabel('Replied by')
+
+    axes.set_frame_on(False)
+    figure.tight_layout()
+
+
+def show_chart(draw_chart, data, title):
+    """
+    Show chart of data drawn by draw_chart (e.g. draw_bar_chart) in a
+    window. The window of a chart with the same title is reused and the
+    oldest windows are closed once more than MAX_FIGURES are open.
+    """
+    plot = pyplot()
+    figure = plot.figure('WhatStats - {title}'.format(title=title))
+    figure.clear()
+    draw_chart(figure, data, title)
+    for number in plot.get_fignums()[:-MAX_FIGURES]:
+        if number != figure.number:
+            plot.close(number)
     plot.show()
+
+
+def bar_chart(data, title):
+    """Show bar chart of data tuple (labels, values)."""
+    show_chart(draw_bar_chart, data, title)
+
+
+def doughnut_chart(data, title):
+    """Show doughnut chart of data tuple (labels, values)."""
+    show_chart(draw_doughnut_chart, data, title)
+
+
+def media_chart(data, title):
+    """Show stacked bar chart of media volume (see draw_media_chart)."""
+    show_chart(draw_media_chart, data, title)
+
+
+def line_chart(data, title):
+    """Show line chart of data tuple (dates, [(label, values), ...])."""
+    show_chart(draw_line_chart, data, title)
+
+
+def heatmap(data, title):
+    """Show heatmap of data (see draw_heatmap)."""
+    show_chart(draw_heatmap, data, title)
+
+
+def reply_matrix(data, title):
+    """Show heatmap of who replies to whom (see draw_reply_matrix)."""
+    show_chart(draw_reply_matrix, data, title)
+
+
+def render_chart(draw_chart, data, title, format='png'):
+    """
+    Return bytes of image (in format png/svg) of chart of data drawn off
+    screen by draw_chart (e.g. draw_bar_chart).
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    draw_chart(figure, data, title)
+    image = BytesIO()
+    figure.savefig(image, format=format)
+    return image.getvalue()
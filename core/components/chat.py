@@ -1,18 +1,44 @@
-import re
-from datetime import datetime
-
-TIMESTAMP_PATTERN = r'\[\d{2}/\d{2}/\d{4}, \d{2}:\d{2}:\d{2}]'
-ENCRYPTION_PATTERN = TIMESTAMP_PATTERN + r' (.+): \u200e'
-SUBJECT_PATTERN = (
-    TIMESTAMP_PATTERN
-    + r' \u200e.+ changed the subject to “(.+)”'
-)
-MESSAGE_PATTERN = (
-    r'(?s)'
-    r'\[(?P<timestamp>\d{2}/\d{2}/\d{4}, \d{2}:\d{2}:\d{2})] '
-    r'(?P<sender>[^\u200e].*?): '
-    r'(?P<content>[^\u200e].*)'
-)
+import codecs
+import copy
+import io
+import itertools
+import mmap
+import os
+from array import array
+from hashlib import sha1
+from multiprocessing import Pool
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+from .formats import SNIFF_SIZE, get_format, narrow, sniff
+from .progress import CHECK_INTERVAL
+from .report import SAMPLE_INTERVAL, record_phase
+from .stats import DateIndex, MediaIndex
+from .store import MessageStore, MessageView, from_epoch
+from .words import Vocabulary
+
+# Chat logs can be parsed line by line as they're read (using little
+# memory) or all at once from a buffer of the whole chat log, which the
+# contents of the messages are left in rather than decoded and whose
+# timestamps are decoded in batches (which is faster, see
+# Chat.parse_buffer)
+BACKENDS = ['lines', 'buffer']
+
+# Buffers are checked to be UTF-8 in blocks of this many bytes
+ENCODING_BLOCK_SIZE = 2**20
+# Timestamps of messages parsed from a buffer are decoded in batches of
+# at least this many
+TIMESTAMP_BATCH_SIZE = 4096
+
+# Chat logs smaller than this (once they're extracted) are always parsed
+# in a single process
+PARALLEL_THRESHOLD = 16 * 2**20
+# Chat logs which are parsed in parallel are read in blocks of this many
+# bytes, which is this proportion of the progress of loading them
+READ_BLOCK_SIZE = 2**20
+READ_PROGRESS = 0.2
 
 
 class Chat:
@@ -20,153 +46,788 @@ class Chat:
     Chat object which holds the members of the chat and their messages.
     """
 
-    def __init__(self, chat_log_path):
-        self.chat_log_path = chat_log_path
-        if self.valid_chat_log(chat_log_path):
-            self.subject = self.get_subject(chat_log_path)
-            self.members = MemberList()
-            self.messages = []
-            self.start_date = None
-            self.end_date = None
-        else:
-            raise ValueError
+    def __init__(self, chat_log=None, size=None, tell=None,
+                 log_format=None, file_size=None):
+        """
+        Optional Arguments:
+        chat_log - path of chat log or readable stream of chat log, in
+                   text or binary mode (e.g. from ZipFile.open)
+        size - size of chat log, used to show progress of loading
+               (defaults to size of file at path)
+        tell - function which returns how much of size has been read
+               (defaults to number of bytes/characters read)
+        log_format - name of format of chat log (see formats.FORMATS),
+                     found by sniffing the start of it if None
+        file_size - size of chat log once it's extracted, which decides
+                    whether it's parsed in parallel (defaults to size,
+                    which may be the size of it compressed)
+        """
+        self.chat_log = chat_log
+        self.size = size
+        self.tell = tell
+        self.file_size = file_size
+        self.log_format = (
+            None if log_format is None else get_format(log_format))
+        self.subject = 'none found'
+        # Subject is fixed once it's been found from the encryption notice
+        self.subject_fixed = False
+        # Fingerprint of the chat log, so that a later export of it can be
+        # recognised and only the messages after the last one parsed
+        self.first_line_hash = None
+        self.last_message_offset = None
+        self.last_message_size = None
+        self.last_message_hash = None
+        self.members = MemberList()
+        self.store = MessageStore()
+        self.messages = MessageView(self.store, self.members)
+        self.vocabulary = Vocabulary()
+        self.index = None
+        # Size of each file in the chat log zip by name, which is set
+        # whenever the chat is loaded from one (see archive.load_chat)
+        self.attachment_sizes = {}
+        # Key of the chat in the cache, which is also set by load_chat
+        self.cache_key = None
+        self._media = None
+        self.start_date = None
+        self.end_date = None
+
+    def read_lines(self, chat_log_obj):
+        """
+        Return iterator which iterates over (message, offset) pairs in
+        chat log file object (opened in text or binary mode), where
+        offset is the number of bytes/characters before the message.
+        """
+        start_regex = self.log_format.start_regex
+        position = 0
+        offset = 0
+        message = None
+        for line in chat_log_obj:
+            size = len(line)
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            # If the next line starts with a timestamp then the
+            # current line must be the end of the current message
+            if start_regex.match(line):
+                if message is not None:
+                    yield message.rstrip('\r\n'), offset
+                message = line
+                offset = position
+            elif message is None:
+                # Chat log is only valid if it's first line starts with
+                # a timestamp
+                raise ValueError('Chat log not valid.')
+            else:
+                message += line
+            position += size
+        if message is not None:
+            yield message.rstrip('\r\n'), offset
+
+    def add_message(self, timestamp, sender, content, report=None):
+        """
+        Add message to store, adding sender to members if they're new,
+        where content is a string or a span of the buffer being parsed
+        (see store.ContentColumn.append). If
+        report is given, then member lookup and timestamp parsing are
+        timed and recorded in it.
+        """
+        if report is not None:
+            start = perf_counter()
+        member = self.find_member(sender)
+        if report is not None:
+            lookup_end = perf_counter()
+            report.sample('member lookup', lookup_end - start)
+        timestamp = self.log_format.decode_timestamp(timestamp)
+        if report is not None:
+            report.sample('timestamp parsing', perf_counter() - lookup_end)
+        self.store.append(timestamp, member.id, content)
 
-    def valid_chat_log(self, chat_log_path):
-        """Return True if chat log is valid."""
-        # Chat log is valid if it's first line starts with a timestamp
-        # and contains a line which looks like a message
-        with chat_log_path.open(encoding='utf-8') as chat_log_obj:
+    def find_member(self, sender):
+        """Return member named sender, adding them if they're new."""
+        if self.members.contains(sender):
+            return self.members.find(sender)
+        return self.members.add(sender)
+
+    def load_messages(self, progress=None, workers=None, report=None,
+                      backend=None):
+        """
+        Extract subject, members and messages from chat log in a single
+        pass, possibly publishing the proportion of the chat log which
+        has been read to progress.
+
+        Large chat logs are split into chunks which are parsed in
+        parallel by a pool of processes.
+
+        The format of the chat log is found by sniffing the start of it,
+        unless it was given.
+
+        Raises ValueError if chat log is not valid.
+
+        Optional Arguments:
+        progress - channel to publish progress of loading through and
+                   which loading can be cancelled through from another
+                   thread (progress.Progress)
+        workers - number of processes to parse large chat logs with
+                  (defaults to number of CPUs, 1 to always parse chat
+                  log in this process)
+        report - report to record the phases of loading in
+                 (report.Report)
+        backend - how chat log is parsed when it's not parsed in
+                  parallel (see BACKENDS), defaults to buffer (memory
+                  mapped) for chat logs given by path and lines for
+                  streams
+        """
+        with record_phase(report, 'parse') as phase:
+            if hasattr(self.chat_log, 'read'):
+                chat_log_obj = self.sniff(self.chat_log)
+                loaded = self.parse(chat_log_obj, progress, workers, report,
+                                    backend or 'lines')
+            else:
+                chat_log_path = Path(self.chat_log)
+                if self.size is None:
+                    self.size = chat_log_path.stat().st_size
+                with chat_log_path.open('rb') as chat_log_obj:
+                    self.sniff(chat_log_obj)
+                    loaded = self.parse(chat_log_obj, progress, workers,
+                                        report, backend or 'buffer')
+            # Messages aren't in the store's arrays until it's finalised
+            phase['items'] = len(self.store.contents)
+        if not loaded:
+            return
+
+        if not self.members:
+            raise ValueError('Chat log not valid.')
+
+        with record_phase(report, 'finish loading') as phase:
+            self.finish_loading()
+            phase['items'] = len(self.store)
+
+    def sniff(self, chat_log_obj):
+        """
+        Find format of chat log from the start of chat log file object,
+        unless it's already known, and return file object to parse the
+        chat log from.
+        """
+        if self.log_format is not None:
+            return chat_log_obj
+        if not chat_log_obj.seekable():
+            # Streams which can't be rewound are read into memory instead
+            chat_log = chat_log_obj.read()
+            if isinstance(chat_log, str):
+                chat_log = chat_log.encode('utf-8')
+            chat_log_obj = io.BytesIO(chat_log)
+        sample = chat_log_obj.read(SNIFF_SIZE)
+        if isinstance(sample, str):
+            sample = sample.encode('utf-8')
+        candidates = sniff(sample)
+        # Formats which the start of the chat log can't tell apart are
+        # told apart by reading on until one of them can't decode a
+        # timestamp, which is usually soon after
+        if len(candidates) > 1:
             for line in chat_log_obj:
-                if re.match(TIMESTAMP_PATTERN, line) is None:
+                if isinstance(line, bytes):
+                    line = line.decode('utf-8', 'replace')
+                candidates = narrow(candidates, line)
+                if len(candidates) == 1:
+                    break
+        self.log_format = candidates[0]
+        chat_log_obj.seek(0)
+        return chat_log_obj
+
+    def parse(self, chat_log_obj, progress, workers, report=None,
+              backend='lines'):
+        """
+        Parse chat log file object in this process (with backend) or in
+        parallel, depending on its size. Return False if loading was
+        cancelled. Per message phases are only recorded in report when
+        parsing in this process.
+        """
+        if backend not in BACKENDS:
+            raise ValueError('Unknown backend {!r}.'.format(backend))
+        if workers is None:
+            workers = os.cpu_count() or 1
+        file_size = self.size if self.file_size is None else self.file_size
+        if (workers > 1 and file_size is not None
+                and file_size >= PARALLEL_THRESHOLD):
+            chat_log = self.read_chat_log(chat_log_obj, progress)
+            return (chat_log is not None
+                    and self.parse_parallel(chat_log, progress, workers))
+        if backend == 'lines':
+            return self.parse_chat_log(chat_log_obj, progress, report=report)
+        if isinstance(chat_log_obj, io.BufferedReader) and self.size:
+            # Files on disk are memory mapped rather than read. The map
+            # is closed once it's garbage collected, since the contents
+            # of the messages are kept as spans of it
+            buffer = mmap.mmap(
+                chat_log_obj.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buffer = chat_log_obj.read()
+            if isinstance(buffer, str):
+                buffer = buffer.encode('utf-8')
+        return self.parse_buffer(buffer, progress, report=report)
+
+    def read_chat_log(self, chat_log_obj, progress=None):
+        """
+        Return the rest of chat log file object, which is read a block at
+        a time so that the progress of reading it can be published (as
+        the first READ_PROGRESS of loading it). Return None if loading
+        was cancelled.
+        """
+        blocks = []
+        read = 0
+        while True:
+            block = chat_log_obj.read(READ_BLOCK_SIZE)
+            if not block:
+                break
+            blocks.append(block)
+            read += len(block)
+            if progress is not None:
+                if progress.is_cancelled():
+                    return None
+                if self.size:
+                    position = read if self.tell is None else self.tell()
+                    progress.update(READ_PROGRESS * position / self.size)
+        return blocks[0][:0].join(blocks) if blocks else b''
+
+    def parse_chat_log(self, chat_log_obj, progress=None, continued=False,
+                       report=None):
+        """
+        Extract subject, members and messages from chat log file object.
+        Return False if loading was cancelled.
+
+        If continued is True, then chat log continues from an earlier
+        part of a chat log, so isn't checked for an encryption notice or
+        for being the start of a valid chat log.
+
+        If report is given, then the per message phases of parsing are
+        timed for a sample of messages (see report.SAMPLE_INTERVAL).
+        """
+        return self.parse_messages(
+            self.read_lines(chat_log_obj), progress, continued, report)
+
+    def parse_buffer(self, buffer, progress=None, continued=False,
+                     report=None):
+        """
+        Extract subject, members and messages from chat log buffer (bytes
+        or mmap) in a single pass of a precompiled pattern, which finds
+        where each message starts along with its timestamp and sender, so
+        that only they are decoded (timestamps in batches). The contents
+        of the messages are kept as spans of the buffer. Return False if
+        loading was cancelled. See parse_chat_log.
+        """
+        check_encoding(buffer)
+        log_format = self.log_format
+        store = self.store
+        store.contents.attach(buffer)
+        size = len(buffer)
+        # Messages are gathered into batches which are added to the store
+        # once their timestamps have been decoded all at once, and senders
+        # are looked up by the bytes they're given as so that each is only
+        # decoded once
+        timestamps = []
+        sender_ids = array('i')
+        starts = array('q')
+        ends = array('q')
+        senders = {}
+
+        def flush():
+            store.append_spans(log_format.decode_timestamps(timestamps),
+                               sender_ids, starts, ends)
+            del timestamps[:]
+            for column in sender_ids, starts, ends:
+                del column[:]
+
+        headers = log_format.header_regex.finditer(buffer)
+        match = next(headers, None)
+        # Chat log is only valid if it's first line starts with a timestamp
+        if size and (match is None or match.start() != 0):
+            raise ValueError('Chat log not valid.')
+        i = 0
+        while match is not None:
+            i += 1
+            sample = (report if report is not None
+                      and i % SAMPLE_INTERVAL == 0 else None)
+            offset = match.start()
+            if sample is not None:
+                start = perf_counter()
+            next_match = next(headers, None)
+            if sample is not None:
+                sample.sample('regex matching', perf_counter() - start)
+            end = size if next_match is None else next_match.start()
+            # Line endings after the message aren't part of it
+            while end > offset and buffer[end - 1] in b'\r\n':
+                end -= 1
+            if i % CHECK_INTERVAL == 0:
+                if progress is not None:
+                    if progress.is_cancelled():
+                        return False
+                    progress.update(offset / size)
+                if len(sender_ids) >= TIMESTAMP_BATCH_SIZE:
+                    flush()
+
+            message = None
+            if i == 1 and not continued:
+                message = buffer[offset:end].decode('utf-8')
+                self.parse_start(message)
+            sender = match.group('sender')
+            if sender is not None and match.end() < end:
+                if sample is not None:
+                    start = perf_counter()
+                sender_id = senders.get(sender)
+                if sender_id is None:
+                    sender_id = senders[sender] = self.find_member(
+                        sender.decode('utf-8')).id
+                if sample is not None:
+                    sample.sample('member lookup', perf_counter() - start)
+                timestamp = match.group('timestamp')
+                content_start, content_end = match.end(), end
+            else:
+                # Notices (and messages which the pattern can't tell apart
+                # from them) are decoded and matched as a whole
+                if message is None:
+                    message = buffer[offset:end].decode('utf-8')
+                message_match = log_format.message_regex.match(message)
+                if message_match:
+                    sender_id = self.find_member(
+                        message_match.group('sender')).id
+                    timestamp = message_match.group('timestamp').encode(
+                        'utf-8')
+                    content_start, content_end = content_span(
+                        message, message_match.start('content'), offset)
+                else:
+                    sender_id = None
+                    self.parse_notice(message, continued, sample)
+            if sender_id is not None:
+                timestamps.append(timestamp)
+                sender_ids.append(sender_id)
+                starts.append(content_start)
+                ends.append(content_end)
+            if next_match is None:
+                self.last_message_offset = offset
+                self.last_message_size = end - offset
+                self.last_message_hash = text_hash(
+                    buffer[offset:end].decode('utf-8'))
+            match = next_match
+        flush()
+        return True
+
+    def parse_messages(self, messages, progress=None, continued=False,
+                       report=None):
+        """
+        Extract subject, members and messages from iterable of (message,
+        offset) pairs of a chat log (see read_lines). Return False if
+        loading was cancelled. See parse_chat_log.
+        """
+        message_regex = self.log_format.message_regex
+        message = None
+        for i, (message, offset) in enumerate(messages, 1):
+            sample = (report if report is not None
+                      and i % SAMPLE_INTERVAL == 0 else None)
+            if progress is not None and i % CHECK_INTERVAL == 0:
+                if progress.is_cancelled():
                     return False
-                elif re.match(MESSAGE_PATTERN, line):
-                    return True
+                if self.size:
+                    position = offset if self.tell is None else self.tell()
+                    progress.update(position / self.size)
+            if i == 1 and not continued:
+                self.parse_start(message)
 
-    def get_subject(self, chat_log_path):
-        """Return subject of chat."""
-        with chat_log_path.open(encoding='utf-8') as chat_log_obj:
-            match = re.match(ENCRYPTION_PATTERN, chat_log_obj.readline())
+            if sample is not None:
+                start = perf_counter()
+            match = message_regex.match(message)
+            if sample is not None:
+                sample.sample('regex matching', perf_counter() - start)
             if match:
-                return match.group(1)
+                self.add_message(
+                    match.group('timestamp'), match.group('sender'),
+                    match.group('content'), sample)
             else:
-                matches = re.findall(SUBJECT_PATTERN, chat_log_obj.read())
-                return matches[-1] if matches else 'none found'
+                self.parse_notice(message, continued, sample)
 
-    def read_lines(self, chat_log_path):
-        """Return iterator which iterates over lines in chat log."""
-        with chat_log_path.open(encoding='utf-8') as chat_log_obj:
-            message = chat_log_obj.readline()
-            for line in chat_log_obj:
-                # If the next line starts with a timestamp then the
-                # current line must be the end of the current message
-                if re.match(TIMESTAMP_PATTERN, line):
-                    yield message.rstrip('\n')
-                    message = line
-                else:
-                    message += line
-            yield message.rstrip('\n')
+        if message is not None:
+            self.last_message_offset = offset
+            self.last_message_size = len(message.encode('utf-8'))
+            self.last_message_hash = text_hash(message)
+        return True
+
+    def parse_start(self, message):
+        """
+        Fingerprint the first line of the chat log, which message is the
+        first message of, and set subject if it's an encryption notice.
+        """
+        self.first_line_hash = text_hash(message.split('\n', 1)[0])
+        # Subject is the name given to the encryption notice if the chat
+        # log starts with one
+        encryption_regex = self.log_format.encryption_regex
+        match = encryption_regex and encryption_regex.match(message)
+        if match:
+            self.subject = match.group('subject')
+            self.subject_fixed = True
+
+    def parse_notice(self, message, continued=False, sample=None):
+        """
+        Set subject if message, which wasn't sent by a member, is a
+        subject change. Per message phases are recorded in sample if it's
+        given.
+        """
+        if not self.members and not continued and '\n' in message:
+            # Chat log is only valid if every line before the first
+            # message starts with a timestamp
+            raise ValueError('Chat log not valid.')
+        if not self.subject_fixed:
+            # Otherwise, subject is the last one it was changed to
+            if sample is not None:
+                start = perf_counter()
+            match = self.log_format.subject_regex.match(message)
+            if sample is not None:
+                sample.sample('subject search', perf_counter() - start)
+            if match:
+                self.subject = match.group('subject')
+
+    def new_lines(self, chat_log_obj):
+        """
+        Return (lines, offset) if chat log file object (opened in binary
+        mode) is a later export of this chat's chat log, where lines
+        iterates over the lines after the last message of this chat,
+        which start at offset. Otherwise, return None.
+        """
+        if self.last_message_hash is None:
+            return None
+        first_line = chat_log_obj.readline()
+        if (not isinstance(first_line, bytes)
+                or text_hash(first_line.decode('utf-8').rstrip('\r\n'))
+                != self.first_line_hash):
+            return None
+
+        # Skip straight to the last message of this chat and check that
+        # the chat log contains it
+        if chat_log_obj.seekable():
+            chat_log_obj.seek(self.last_message_offset)
+        else:
+            skip = self.last_message_offset - len(first_line)
+            while skip > 0:
+                skipped = len(chat_log_obj.read(min(skip, 2**20)))
+                if not skipped:
+                    return None
+                skip -= skipped
+        last_message = chat_log_obj.read(self.last_message_size)
+        last_message = last_message.decode('utf-8', 'replace')
+        if text_hash(last_message) != self.last_message_hash:
+            return None
 
-    def add_message(self, timestamp, sender, content):
-        """Add message to list of messages."""
-        self.messages.append(Message(timestamp, sender, content))
+        # The rest of the line ending the last message (and any blank
+        # lines) are part of it, so the next message must come next
+        offset = self.last_message_offset + self.last_message_size
+        for line in chat_log_obj:
+            if line.strip(b'\r\n'):
+                return itertools.chain([line], chat_log_obj), offset
+            offset += len(line)
+        return iter([]), offset
 
-    def load_messages(self, loading_dialog=None, exit_flag=None):
+    def load_new_messages(self, chat_log_obj, progress=None, size=None,
+                          tell=None, report=None):
         """
-        Extract members and messages from chat log, possibly updating
-        optional loading dialog as each line is parsed.
+        If chat log file object (opened in binary mode) is a later export
+        of this chat's chat log, then add the messages which were sent
+        after the last message of this chat to it (only parsing them) and
+        return True. Otherwise, return False.
 
         Optional Arguments:
-        loading_dialog - dialog so status of chat log parsing can be
-                         shown to user (gui.LoadingDialog)
-        exit_flag - exit flag so that loading can be aborted from
-                    another thread (threading.Event)
+        progress, report - see load_messages
+        size, tell - see Chat
         """
-        if loading_dialog is not None:
-            lines = sum(1 for _ in self.read_lines(self.chat_log_path))
+        with record_phase(report, 'fingerprint check'):
+            new_lines = self.new_lines(chat_log_obj)
+        if new_lines is None:
+            return False
+        lines, offset = new_lines
+        new_chat = Chat(size=size, tell=tell,
+                        log_format=self.log_format.name)
+        new_chat.subject = None
+        with record_phase(report, 'parse') as phase:
+            loaded = new_chat.parse_chat_log(
+                lines, progress, continued=True, report=report)
+            phase['items'] = len(new_chat.store.contents)
+        if loaded:
+            with record_phase(report, 'finish loading') as phase:
+                self.merge(new_chat, offset)
+                self.finish_loading()
+                phase['items'] = len(self.store)
+        return True
 
-        for i, message in enumerate(self.read_lines(self.chat_log_path), 1):
-            if loading_dialog.WasCancelled():
-                if exit_flag is not None:
-                    exit_flag.set()
-                return
+    def parse_parallel(self, chat_log, progress, workers):
+        """
+        Split chat log (bytes or str) into chunks, parse them in a pool
+        of worker processes and merge the results in order. Return False
+        if loading was cancelled.
+        """
+        if isinstance(chat_log, str):
+            chat_log = chat_log.encode('utf-8')
+        chunks = split_chat_log(chat_log, workers, self.log_format)
+        # Workers look formats up by name rather than compiling their
+        # patterns again
+        tasks = [(chunk, i > 0, self.log_format.name)
+                 for i, chunk in enumerate(chunks)]
+        offset = 0
+        with Pool(workers) as pool:
+            for i, chunk_chat in enumerate(pool.imap(parse_chunk, tasks), 1):
+                if progress is not None and progress.is_cancelled():
+                    return False
+                if i == 1:
+                    self.first_line_hash = chunk_chat.first_line_hash
+                chunk_chat.store.contents.rebase(chat_log, offset)
+                self.merge(chunk_chat, offset)
+                offset += len(chunks[i - 1])
+                if progress is not None:
+                    progress.update(READ_PROGRESS + (1 - READ_PROGRESS)
+                                    * i / len(chunks))
+        return True
 
-            match = re.match(MESSAGE_PATTERN, message)
-            if match:
-                timestamp = match.group('timestamp')
-                sender = match.group('sender')
-                content = match.group('content')
-                self.add_message(timestamp, sender, content)
-                if self.members.contains(sender):
-                    member = self.members.find(sender)
-                    member.add_message(timestamp, sender, content)
-                else:
-                    self.members.add(timestamp, sender, content)
+    def merge(self, chunk_chat, offset):
+        """
+        Add subject, members and messages of chat parsed from the next
+        chunk of the chat log, which starts at offset.
+        """
+        if chunk_chat.subject is not None and not self.subject_fixed:
+            self.subject = chunk_chat.subject
+            self.subject_fixed = chunk_chat.subject_fixed
+        if chunk_chat.last_message_hash is not None:
+            self.last_message_offset = offset + chunk_chat.last_message_offset
+            self.last_message_size = chunk_chat.last_message_size
+            self.last_message_hash = chunk_chat.last_message_hash
+        # Members are matched by the name they're given in the chat log,
+        # since they may have been renamed since
+        sender_ids = []
+        for member in chunk_chat.members:
+            if self.members.contains_sender(member.sender):
+                sender_ids.append(self.members.find_sender(member.sender).id)
+            else:
+                sender_ids.append(self.members.add(member.sender).id)
+        self.store.extend(chunk_chat.store, np.array(sender_ids, np.int32))
 
-            if loading_dialog is not None and i % 1000 == 0:
-                loading_dialog.Update(100 * i / lines)
+    def finish_loading(self):
+        """
+        Finalise store once messages have been added to it, then update
+        members, index and start/end dates to include the new messages.
+        """
+        self.store.finalise()
+        self.update_members()
+        self.index = DateIndex(self.store, len(self.members))
+        self.start_date = from_epoch(self.store.timestamps[0]).date()
+        self.end_date = from_epoch(self.store.timestamps[-1]).date()
 
-        self.start_date = self.messages[0].timestamp.date()
-        self.end_date = self.messages[-1].timestamp.date()
+    def count_words(self):
+        """
+        Return vocabulary of chat once the words of the messages which
+        haven't been counted have been (by one thread at a time). Words
+        are only counted when they're first needed, since every message
+        is read again to count them.
+        """
+        with self.store.lock:
+            self.vocabulary.count(self.store)
+        return self.vocabulary
 
+    @property
+    def media(self):
+        """
+        Index of the messages with attachments (stats.MediaIndex), which is
+        built when it's first needed and again once messages are added or
+        the sizes of the attachments change.
+        """
+        with self.store.lock:
+            media = self._media
+            if (media is None or media.size != len(self.store)
+                    or media.attachment_sizes is not self.attachment_sizes):
+                media = self._media = MediaIndex(
+                    self.store, self.attachment_sizes)
+            return media
 
-class MemberList(list):
-    """List object which contains chat members."""
+    def copy(self):
+        """
+        Return copy of chat which messages can be added to (see
+        load_new_messages) without changing this chat, whose statistics
+        may be being computed in other threads at the same time. The
+        messages themselves are shared rather than copied.
+        """
+        chat = copy.copy(self)
+        chat.members = self.members.copy()
+        chat.store = self.store.copy()
+        chat.messages = MessageView(chat.store, chat.members)
+        with self.store.lock:
+            chat.vocabulary = copy.deepcopy(self.vocabulary)
+        chat._media = None
+        for member, original in zip(chat.members, self.members):
+            if original.messages is not None:
+                member.messages = MessageView(
+                    chat.store, chat.members, original.messages.positions)
+        return chat
 
-    def add(self, timestamp, sender, content):
-        """Add member to list along with their first message."""
-        self.append(Member(sender))
-        self[-1].add_message(timestamp, sender, content)
+    def update_members(self):
+        """Point each member's messages at their messages in the store."""
+        indices = self.store.sender_indices(len(self.members))
+        for member, positions in zip(self.members, indices):
+            member.messages = MessageView(self.store, self.members, positions)
 
-    def contains(self, name):
-        """Return true if there is a member with name."""
-        return name in [member.name for member in self]
 
-    def find(self, name):
-        """Return member with name."""
-        return [member for member in self if member.name == name][0]
+def split_chat_log(chat_log, count, log_format):
+    """
+    Return list of (at most) count chunks of roughly equal size which
+    chat log (bytes) in format (formats.LogFormat) is split into, at lines
+    which start with a timestamp.
+    """
+    chunks = []
+    start = 0
+    for i in range(1, count):
+        match = log_format.chunk_boundary_regex.search(
+            chat_log, max(start, len(chat_log) * i // count))
+        if match is None:
+            break
+        chunks.append(chat_log[start:match.end()])
+        start = match.end()
+    chunks.append(chat_log[start:])
+    return chunks
 
 
-class Member:
-    """Member object which holds each member's name and messages."""
+def check_encoding(buffer):
+    """
+    Raise ValueError (UnicodeDecodeError) if buffer isn't UTF-8, which is
+    decoded a block at a time so that it isn't all decoded at once.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for start in range(0, len(buffer), ENCODING_BLOCK_SIZE):
+        decoder.decode(buffer[start:start + ENCODING_BLOCK_SIZE])
+    decoder.decode(b'', final=True)
 
-    def __init__(self, name):
-        self.name = name
-        self.messages = []
 
-    def add_message(self, timestamp, sender, content):
-        """Add message to list of member's messages."""
-        self.messages.append(Message(timestamp, sender, content))
+def content_span(message, content_start, offset):
+    """
+    Return (start, end) of the bytes of the content of message, which was
+    decoded from a buffer at offset, where the content starts at the
+    character content start and runs to the end of the message.
+    """
+    if message.isascii():
+        return offset + content_start, offset + len(message)
+    start = offset + len(message[:content_start].encode('utf-8'))
+    return start, offset + len(message.encode('utf-8'))
 
-    def __repr__(self):
-        return self.name
+
+def parse_chunk(task):
+    """
+    Return chat parsed from (chunk, continued, log_format) task, where
+    chunk is a chunk of a chat log, continued is True if it's not the
+    first and log_format is the name of the format of the chat log.
+    """
+    chunk, continued, log_format = task
+    chat = Chat(log_format=log_format)
+    chat.subject = None
+    chat.parse_buffer(chunk, continued=continued)
+    # Types, word counts and words are left to be found when they're first
+    # needed, as they are when chat logs are parsed in a single process
+    chat.store.finalise()
+    # Contents are spans of the chunk, which is a part of the chat log
+    # which the parent process already has
+    chat.store.contents.detach()
+    return chat
+
+
+def text_hash(text):
+    """Return hash of text, used to fingerprint chat logs."""
+    return sha1(text.encode('utf-8')).hexdigest()
 
 
-class Message:
+class MemberList(list):
+    """
+    List object which contains chat members, indexed by name (and by the
+    name they're given in the chat log) so that members can be found in
+    constant time. Generation counts how many times members have been
+    renamed, so that data which names them can tell when it's stale.
     """
-    Message object which holds the message's timestamp and content.
 
-    Types: text, image, video, gif, document, location, contact
+    def __init__(self):
+        super().__init__()
+        self.index = {}
+        self.senders = {}
+        self.generation = 0
+
+    def add(self, name):
+        """Add member with name to list and return them."""
+        member = Member(name, len(self), self)
+        self.append(member)
+        self.index.setdefault(name, member)
+        self.senders.setdefault(name, member)
+        return member
+
+    def copy(self):
+        """Return copy of list which holds copies of its members."""
+        members = MemberList()
+        for member in self:
+            new_member = Member(member.name, member.id, members)
+            new_member.sender = member.sender
+            members.append(new_member)
+        members.index = {
+            name: members[member.id] for name, member in self.index.items()}
+        members.senders = {
+            sender: members[member.id]
+            for sender, member in self.senders.items()}
+        members.generation = self.generation
+        return members
+
+    def contains_sender(self, sender):
+        """Return true if there is a member named sender in chat log."""
+        return sender in self.senders
+
+    def find_sender(self, sender):
+        """Return member named sender in chat log."""
+        return self.senders[sender]
+
+    def contains(self, name):
+        """Return true if there is a member with name."""
+        return name in self.index
+
+    def find(self, name):
+        """Return member with name."""
+        return self.index[name]
+
+    def rename(self, member, name):
+        """Update index when member's name is about to be changed to name."""
+        old_name = member.name
+        if self.index.get(old_name) is member:
+            del self.index[old_name]
+            # Another member may share the old name, in which case the
+            # first of them should now be found by it
+            for other in self:
+                if other is not member and other.name == old_name:
+                    self.index[old_name] = other
+                    break
+        if name not in self.index or self.index[name].id > member.id:
+            self.index[name] = member
+        self.generation += 1
+
+
+class Member:
+    """
+    Member object which holds each member's name, the name they're given
+    in the chat log (sender), id (their position in the member list) and
+    a view of their messages.
     """
 
-    def __init__(self, timestamp, sender, content):
-        self.timestamp = datetime.strptime(timestamp, '%d/%m/%Y, %H:%M:%S')
-        self.sender = sender
-        self.content = content
-        self.type = self.get_type(content)
+    def __init__(self, name, id, member_list=None):
+        self._name = name
+        self.sender = name
+        self.id = id
+        self.member_list = member_list
+        self.messages = None
 
-    def get_type(self, content):
-        """Return the type of the message based on the content."""
-        # Non text messages contain the character \u200e which is
-        # followed by the type of the message
-        match = re.search(r'\u200e(\w+)', content)
-        return match.group(1).lower() if match else 'text'
+    @property
+    def name(self):
+        return self._name
 
-    def words(self):
-        """Return list of words in message if message is a text."""
-        return self.content.split() if self.type == 'text' else None
+    @name.setter
+    def name(self, name):
+        # Keep member list index up to date when member is renamed (e.g.
+        # by gui.MembersList)
+        if self.member_list is not None:
+            self.member_list.rename(self, name)
+        self._name = name
 
     def __repr__(self):
-        return '{timestamp}: {sender}: {content}'.format(
-            timestamp=self.timestamp,
-            sender=self.sender,
-            content=self.content)
+        return self.name
@@ -1,4 +1,31 @@
-from .stats import messages_sent, words_sent
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Number of statistics results kept by StatisticsCache
+STATISTICS_CACHE_SIZE = 64
+# Number of words shown by most used words statistics
+TOP_WORDS = 20
+# Number of members shown by reply time statistics
+TOP_REPLIERS = 20
+# Members who replied fewer times than this aren't ranked by how quickly
+# they reply, since their median reply time is mostly down to chance
+MIN_REPLIES = 10
+
+
+def sorted_data(members, counts):
+    """
+    Return (x, y) where x is list of the members with a non zero count and
+    y is a list of their respective counts, sorted by count.
+    """
+    pairs = sorted(
+        ((int(count), member.name)
+         for member, count in zip(members, counts) if count > 0),
+        reverse=True)
+    x = [name for _, name in pairs]
+    y = [count for count, _ in pairs]
+    return (x, y)
 
 
 def messages_sent_data(chat, start_date, end_date, message_type=None):
@@ -7,16 +34,9 @@ def messages_sent_data(chat, start_date, end_date, message_type=None):
     respective message counts between start and end date, sorted by message
     count.
     """
-    x = []
-    y = []
-    for member in chat.members:
-        count = messages_sent(member, start_date, end_date, message_type)
-        if count > 0:
-            x.append(member.name)
-            y.append(count)
-    x = [i for _, i in sorted(zip(y, x), reverse=True)]
-    y.sort(reverse=True)
-    return (x, y)
+    metric = 'messages' if message_type is None else message_type
+    counts = chat.index.aggregate(start_date, end_date, [metric])[metric]
+    return sorted_data(chat.members, counts)
 
 
 def words_sent_data(chat, start_date, end_date):
@@ -24,13 +44,171 @@ def words_sent_data(chat, start_date, end_date):
     Return (x, y) where x is list of members and y is a list of their
     respective word counts between start and end date, sorted by word count.
     """
-    x = []
-    y = []
-    for member in chat.members:
-        count = words_sent(member, start_date, end_date)
-        if count > 0:
-            x.append(member.name)
-            y.append(count)
-    x = [i for _, i in sorted(zip(y, x), reverse=True)]
-    y.sort(reverse=True)
+    counts = chat.index.aggregate(start_date, end_date, ['words'])['words']
+    return sorted_data(chat.members, counts)
+
+
+def activity_data(chat, start_date, end_date, period):
+    """
+    Return (x, series) where x is list of the first day of each period
+    (day/week/month) between start and end date and series is a list of
+    (member, counts) pairs of the members who sent messages between them
+    and the number they sent in each period, sorted by total.
+    """
+    starts, counts = chat.index.activity(start_date, end_date, period)
+    totals = counts.sum(axis=1)
+    ranked = sorted(
+        ((int(total), member.name, i)
+         for i, (member, total) in enumerate(zip(chat.members, totals))
+         if total > 0),
+        reverse=True)
+    series = [(name, counts[i].tolist()) for _, name, i in ranked]
+    return (starts, series)
+
+
+def heatmap_data(chat, start_date, end_date):
+    """
+    Return list of lists of the number of messages sent between start and
+    end date in each hour of each day of the week (starting on Monday).
+    """
+    return chat.index.heatmap(start_date, end_date).tolist()
+
+
+def most_used_words_data(chat, members=None, n=TOP_WORDS):
+    """
+    Return (x, y) where x is list of the n words used most by members (or
+    by every member of chat if members isn't given) and y is a list of
+    the number of times they used them, in the whole chat.
+    """
+    sender_ids = None if members is None else [
+        member.id for member in members]
+    words, _ = chat.count_words().most_common(n, sender_ids)
+    x = [word for word, _ in words]
+    y = [count for _, count in words]
+    return (x, y)
+
+
+def reply_time_data(chat, start_date, end_date, n=TOP_REPLIERS):
+    """
+    Return (x, y) where x is list of the n members who replied quickest
+    between start and end date (out of those who replied at least
+    MIN_REPLIES times) and y is a list of their respective median reply
+    times in minutes, sorted by reply time.
+    """
+    medians, counts = chat.index.reply_times(start_date, end_date)
+    pairs = sorted(
+        (float(median), member.name)
+        for member, median, count in zip(chat.members, medians, counts)
+        if count >= MIN_REPLIES)[:n]
+    x = [name for _, name in pairs]
+    y = [round(median / 60, 1) for median, _ in pairs]
     return (x, y)
+
+
+def replies_data(chat, start_date, end_date):
+    """
+    Return (x, counts) where x is list of the members who replied or were
+    replied to between start and end date, sorted by the number of
+    replies they sent, and counts is a list of lists of the number of
+    times each of them (rows) replied to each of them (columns).
+    """
+    counts = chat.index.reply_counts(start_date, end_date)
+    sent = counts.sum(axis=1)
+    received = counts.sum(axis=0)
+    ranked = sorted(
+        ((int(sent[i]), int(received[i]), i)
+         for i in range(len(chat.members)) if sent[i] or received[i]),
+        reverse=True)
+    order = [i for _, _, i in ranked]
+    x = [chat.members[i].name for i in order]
+    return (x, counts[order][:, order].tolist())
+
+
+def conversations_started_data(chat, start_date, end_date):
+    """
+    Return (x, y) where x is list of members and y is a list of the
+    number of conversations they respectively started between start and
+    end date, sorted by conversations started.
+    """
+    starters, _, _ = chat.index.sessions(start_date, end_date)
+    counts = np.bincount(starters, minlength=len(chat.members))
+    return sorted_data(chat.members, counts)
+
+
+def media_volume_data(chat, start_date, end_date):
+    """
+    Return (x, series) where x is list of the members who sent attachments
+    between start and end date, sorted by their total size, and series is
+    a list of (type, sizes, counts) tuples of each type of attachment,
+    sorted by total size, where sizes is a list of the total size in bytes
+    of the attachments of the type which the members respectively sent
+    and counts is a list of how many of them they sent.
+    """
+    sizes, counts = chat.media.volume(
+        start_date, end_date, len(chat.members))
+    member_sizes = sizes.sum(axis=1)
+    member_counts = counts.sum(axis=1)
+    members = [i for _, _, i in sorted(
+        ((int(member_sizes[i]), int(member_counts[i]), i)
+         for i in range(len(chat.members)) if member_counts[i]),
+        reverse=True)]
+    type_sizes = sizes.sum(axis=0)
+    type_counts = counts.sum(axis=0)
+    types = [i for _, _, i in sorted(
+        ((int(type_sizes[i]), int(type_counts[i]), i)
+         for i in range(sizes.shape[1]) if type_counts[i]),
+        reverse=True)]
+    x = [chat.members[i].name for i in members]
+    series = [
+        (chat.store.types[i], sizes[members, i].tolist(),
+         counts[members, i].tolist())
+        for i in types
+    ]
+    return (x, series)
+
+
+def aggregate_data(chat, start_date, end_date, metrics=None):
+    """
+    Return dict of (x, y) tuples for each metric (see stats.METRICS),
+    where x is list of members and y is a list of their respective totals
+    between start and end date, sorted by total.
+    """
+    totals = chat.index.aggregate(start_date, end_date, metrics)
+    return {
+        metric: sorted_data(chat.members, counts)
+        for metric, counts in totals.items()
+    }
+
+
+class StatisticsCache:
+    """
+    Thread safe, size bounded cache of statistics data (see
+    messages_sent_data etc.) which evicts the least recently used data
+    first.
+    """
+
+    def __init__(self, max_size=STATISTICS_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Return data cached with key, or None if it's not cached."""
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        """Cache data with key, evicting old data if cache is full."""
+        with self.lock:
+            self.entries[key] = data
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all data from cache."""
+        with self.lock:
+            self.entries.clear()
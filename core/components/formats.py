@@ -0,0 +1,268 @@
+import re
+from functools import partial
+
+from .timestamps import (decode_each, decode_short_timestamp,
+                         decode_timestamp, decode_timestamps,
+                         decode_variable_timestamp)
+
+# Format of chat log is found from this many bytes at the start of it
+SNIFF_SIZE = 4096
+
+# Newer versions put this before am/pm. It's given as is rather than
+# matched by \s, since patterns are also matched against bytes (where \s
+# only matches ASCII whitespace)
+NARROW_NO_BREAK_SPACE = '\u202f'
+# Newer versions put this at the start of lines of messages with
+# attachments (given as is for the same reason)
+LEFT_TO_RIGHT_MARK = '\u200e'
+# Times with or without seconds, on the 24 or 12 hour clock
+VARIABLE_TIME_PATTERN = (
+    r'\d{1,2}:\d{2}(?::\d{2})?'
+    r'(?:(?: |' + NARROW_NO_BREAK_SPACE + r')?[AaPp]\.?\s?[Mm]\.?)?'
+)
+VARIABLE_TIMESTAMP_PATTERN = (
+    r'(?P<timestamp>\d{1,2}[/.]\d{1,2}[/.]\d{2,4},? '
+    + VARIABLE_TIME_PATTERN + ')'
+)
+
+
+class LogFormat:
+    """
+    Format of the chat logs exported by a version of WhatsApp, made up of
+    precompiled patterns which match the start of a message (whose
+    timestamp group is its timestamp), a whole message (with timestamp,
+    sender and content groups), the encryption notice (whose subject group
+    is the subject of the chat) and a subject change (whose subject group
+    is the new subject), along with a function which returns the epoch
+    seconds of a timestamp.
+    """
+
+    def __init__(self, name, start_pattern, message_pattern,
+                 subject_pattern, decode_timestamp, sender_pattern,
+                 encryption_pattern=None, day_first=True,
+                 decode_timestamps=None):
+        """
+        Arguments:
+        name - name of format
+        start_pattern - pattern which matches the start of every line
+                        which starts a message
+        message_pattern - pattern which matches a message which was sent
+                          by a member, rather than a notice
+        subject_pattern - pattern which matches a subject change
+        decode_timestamp - function which returns the epoch seconds of a
+                           timestamp, raising ValueError if it's malformed
+        sender_pattern - pattern which matches the sender group of a
+                         message sent by a member and what separates it
+                         from the content, when it follows the start of
+                         the message on its first line (matched against
+                         bytes)
+
+        Optional Arguments:
+        encryption_pattern - pattern which matches an encryption notice
+                             which gives the subject of the chat (None if
+                             the format doesn't have one)
+        day_first - whether the day comes before the month in timestamps
+        decode_timestamps - function which returns an array of the epoch
+                            seconds of a list of timestamps given as
+                            bytes all at once (defaults to decoding them
+                            one at a time with decode_timestamp)
+        """
+        self.name = name
+        self.start_regex = re.compile(start_pattern)
+        self.message_regex = re.compile(message_pattern)
+        self.subject_regex = re.compile(subject_pattern)
+        self.encryption_regex = (
+            None if encryption_pattern is None
+            else re.compile(encryption_pattern))
+        self.decode_timestamp = decode_timestamp
+        self.decode_timestamps = (
+            partial(decode_each, decode_timestamp)
+            if decode_timestamps is None else decode_timestamps)
+        self.day_first = day_first
+        # Every message starts at the start of a line which starts with a
+        # timestamp, which is followed by a sender unless it's a notice
+        self.header_regex = re.compile(
+            ('^' + start_pattern + '(?:' + sender_pattern + ')?')
+            .encode('utf-8'), re.MULTILINE)
+        # Chat log can be split into chunks at any line which starts with
+        # a timestamp without splitting a message
+        self.chunk_boundary_regex = re.compile(
+            ('\n(?=' + start_pattern + ')').encode('utf-8'))
+
+    def timestamps(self, lines):
+        """
+        Return list of epoch seconds of the timestamps of this format at
+        the start of lines, skipping any which can't be decoded or are
+        before the one before.
+        """
+        timestamps = []
+        for line in lines:
+            match = self.start_regex.match(line)
+            if match:
+                try:
+                    timestamp = self.decode_timestamp(
+                        match.group('timestamp'))
+                except ValueError:
+                    continue
+                if not timestamps or timestamp >= timestamps[-1]:
+                    timestamps.append(timestamp)
+        return timestamps
+
+    def rejects(self, line):
+        """
+        Return True if line starts with a timestamp of this format which
+        can't be decoded.
+        """
+        match = self.start_regex.match(line)
+        if match is None:
+            return False
+        try:
+            self.decode_timestamp(match.group('timestamp'))
+        except ValueError:
+            return True
+        return False
+
+    def __repr__(self):
+        return 'LogFormat({!r})'.format(self.name)
+
+
+def ios_format(name, timestamp_pattern, decode_timestamp, day_first=True,
+               decode_timestamps=None):
+    """
+    Return format of chat logs exported from iOS, whose messages look like
+    [timestamp] sender: content.
+    """
+    start_pattern = (
+        '(?:' + LEFT_TO_RIGHT_MARK + r')?\[' + timestamp_pattern + r'] ')
+    return LogFormat(
+        name,
+        start_pattern,
+        # Notices have a \u200e character before the sender or content,
+        # which attachments also have before their content
+        r'(?s)' + start_pattern + r'(?P<sender>[^\u200e].*?): '
+        r'(?P<content>(?:[^\u200e]|\u200e<attached: ).*)',
+        start_pattern
+        + r'\u200e.+ changed the subject to “(?P<subject>.+)”',
+        decode_timestamp,
+        '(?!' + LEFT_TO_RIGHT_MARK + r')(?P<sender>[^\n]+?): (?!'
+        + LEFT_TO_RIGHT_MARK + '(?!<attached: ))',
+        start_pattern + r'(?P<subject>.+): \u200e(?!<attached: )',
+        day_first,
+        decode_timestamps,
+    )
+
+
+def android_format(name, timestamp_pattern, decode_timestamp,
+                   day_first=True, decode_timestamps=None):
+    """
+    Return format of chat logs exported from Android, whose messages look
+    like timestamp - sender: content.
+    """
+    start_pattern = timestamp_pattern + r' - '
+    return LogFormat(
+        name,
+        start_pattern,
+        # Notices don't have a sender
+        r'(?s)' + start_pattern + r'(?P<sender>[^:\n]+?): (?P<content>.*)',
+        # Subject is given when the group is created and when it's changed
+        start_pattern + r'.+ (?:created group|changed the subject '
+        r'(?:from ["“].*["”] )?to) ["“](?P<subject>.+)["”]$',
+        decode_timestamp,
+        r'(?P<sender>[^:\n]+?): ',
+        day_first=day_first,
+        decode_timestamps=decode_timestamps,
+    )
+
+
+IOS = ios_format(
+    'ios', r'(?P<timestamp>\d{2}/\d{2}/\d{4}, \d{2}:\d{2}:\d{2})',
+    decode_timestamp, decode_timestamps=decode_timestamps)
+ANDROID = android_format(
+    'android', r'(?P<timestamp>\d{2}/\d{2}/\d{4}, \d{2}:\d{2})',
+    decode_short_timestamp,
+    decode_timestamps=partial(decode_timestamps, short=True))
+
+# Formats in the order they're preferred when sniffing can't tell them
+# apart. The formats with fixed timestamps come first since they have
+# their own fast timestamp decoders, then the day first variants since
+# the day can't be told apart from the month when it's at most 12.
+FORMATS = {}
+
+
+def register_format(log_format):
+    """Add format to the formats which chat logs are sniffed for."""
+    FORMATS[log_format.name] = log_format
+    return log_format
+
+
+for log_format in [
+        IOS,
+        ANDROID,
+        ios_format('ios-dmy', VARIABLE_TIMESTAMP_PATTERN,
+                   decode_variable_timestamp),
+        android_format('android-dmy', VARIABLE_TIMESTAMP_PATTERN,
+                       decode_variable_timestamp),
+        ios_format('ios-mdy', VARIABLE_TIMESTAMP_PATTERN,
+                   partial(decode_variable_timestamp, day_first=False),
+                   day_first=False),
+        android_format('android-mdy', VARIABLE_TIMESTAMP_PATTERN,
+                       partial(decode_variable_timestamp, day_first=False),
+                       day_first=False),
+]:
+    register_format(log_format)
+
+
+def get_format(name):
+    """Return format with name, raising ValueError if there isn't one."""
+    try:
+        return FORMATS[name]
+    except KeyError:
+        raise ValueError('Unknown chat log format {!r}.'.format(name)) \
+            from None
+
+
+def sniff(sample):
+    """
+    Return list of the formats which chat log which starts with sample
+    (bytes or str, see SNIFF_SIZE) is most likely to be in, most preferred
+    first. Raises ValueError if none of its lines are in any format.
+
+    The most lines of the sample are in these formats (see
+    LogFormat.timestamps), and their timestamps span the least time,
+    since they're all from the start of the same chat. Formats which
+    decode the sample in the same way as one which is preferred to them
+    (with the day and month the same way round) are left out, so there is
+    only more than one format if the sample can't tell them apart (e.g.
+    if every day in it is at most 12). See narrow.
+    """
+    if isinstance(sample, bytes):
+        # Sample may end part way through a character
+        sample = sample.decode('utf-8', 'ignore')
+    lines = sample.splitlines()
+    best_score = (0, 0)
+    candidates = {}
+    for log_format in FORMATS.values():
+        timestamps = log_format.timestamps(lines)
+        if not timestamps:
+            continue
+        score = (len(timestamps), timestamps[0] - timestamps[-1])
+        if score > best_score:
+            best_score = score
+            candidates = {}
+        if score == best_score:
+            candidates.setdefault(
+                (tuple(timestamps), log_format.day_first), log_format)
+    if not candidates:
+        raise ValueError('Chat log not valid.')
+    return list(candidates.values())
+
+
+def narrow(candidates, line):
+    """
+    Return list of the candidate formats (see sniff) which don't reject
+    line of chat log (see LogFormat.rejects), or the candidates if they
+    all do.
+    """
+    return ([log_format for log_format in candidates
+             if not log_format.rejects(line)]
+            or candidates)
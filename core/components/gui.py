@@ -1,5 +1,6 @@
 import wx
 import wx.adv
+import wx.lib.dialogs
 import wx.lib.mixins.listctrl as listmixin
 from ObjectListView import ObjectListView, ColumnDefn
 
@@ -32,8 +33,12 @@ class MainMenuBar(wx.MenuBar):
         super().__init__()
         file_menu = wx.Menu()
         file_menu.Append(wx.ID_OPEN, 'Import Chat Log\tCtrl+O')
+        file_menu.Append(wx.ID_REFRESH, 'Update Chat Log\tCtrl+U')
         file_menu.Append(wx.ID_EXIT, 'Quit\tCtrl+Q')
         self.Append(file_menu, '&File')
+        help_menu = wx.Menu()
+        help_menu.Append(wx.ID_INFO, 'Performance Report')
+        self.Append(help_menu, '&Help')
 
 
 class MainPanel(wx.Panel):
@@ -110,6 +115,15 @@ class StatisticChoices(wx.RadioBox):
     CHOICES = [
         'Messages sent',
         'Words sent',
+        'Messages per day',
+        'Messages per week',
+        'Messages per month',
+        'Activity by hour',
+        'Most used words',
+        'Median reply time',
+        'Who replies to whom',
+        'Conversations started',
+        'Media sent',
     ]
 
     def __init__(self, parent, width):
@@ -166,3 +180,21 @@ class LoadingDialog(wx.ProgressDialog):
         super().__init__(parent=parent, message='Importing chat log...',
                          title=title, style=style)
         self.CentreOnParent()
+
+
+class ReportDialog(wx.lib.dialogs.ScrolledMessageDialog):
+    """
+    Dialog which shows how long each phase of the last import and chart
+    took (see report.Report).
+    """
+
+    def __init__(self, parent, reports):
+        message = '\n\n'.join(str(report) for report in reports)
+        if not message:
+            message = 'Nothing has been imported yet.'
+        super().__init__(parent, message, 'Performance Report',
+                         size=(600, 400))
+        # Phases are laid out in columns
+        self.text.SetFont(wx.Font(9, wx.FONTFAMILY_TELETYPE,
+                                  wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_NORMAL))
+        self.CentreOnParent()
@@ -0,0 +1,47 @@
+import threading
+import time
+
+# Progress is published at most once every PUBLISH_INTERVAL seconds
+PUBLISH_INTERVAL = 0.1
+# Parsers only check progress once every CHECK_INTERVAL messages
+CHECK_INTERVAL = 256
+
+
+class Progress:
+    """
+    Thread safe channel through which a loader publishes how much of a
+    chat log has been read and finds out if loading has been cancelled,
+    without depending on the GUI.
+
+    Progress is passed to callback (from the loader's thread) as the
+    proportion of the chat log read, at most once every interval seconds.
+    A GUI callback should hand it over to the main thread (e.g. with
+    wx.CallAfter).
+    """
+
+    def __init__(self, callback=None, interval=PUBLISH_INTERVAL):
+        self.callback = callback
+        self.interval = interval
+        self.cancelled = threading.Event()
+        self.last_published = None
+
+    def update(self, proportion):
+        """
+        Publish proportion of chat log read, unless it was last published
+        less than interval seconds ago.
+        """
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        if (self.last_published is None
+                or now - self.last_published >= self.interval):
+            self.last_published = now
+            self.callback(min(proportion, 1))
+
+    def cancel(self):
+        """Cancel loading (can be called from any thread)."""
+        self.cancelled.set()
+
+    def is_cancelled(self):
+        """Return True if loading has been cancelled."""
+        return self.cancelled.is_set()
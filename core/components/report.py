@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+logger = logging.getLogger('whatstats')
+
+# Phases which happen once per message are only timed for one in every
+# SAMPLE_INTERVAL messages, so that reports are cheap enough to always make
+SAMPLE_INTERVAL = 64
+
+# If set, reports are also appended to this file as lines of JSON
+REPORT_PATH = os.environ.get('WHATSTATS_REPORT')
+
+
+def peak_rss():
+    """
+    Return peak resident set size of process in bytes, or None if it
+    can't be found.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Given in bytes on macOS and kilobytes everywhere else
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class MemoryMark:
+    """
+    Memory use at the start of a phase, which the peak memory use of the
+    phase is found relative to. If tracemalloc is tracing, then this is
+    the traced memory and the traced peak is reset, so that it's the peak
+    of the phase (phases which were already open keep the peak from
+    before). Otherwise, it's the peak resident set size, so the peak of
+    the phase is how far it raised it.
+    """
+
+    # Marks of the phases which are open (on any thread)
+    open_marks = []
+    lock = threading.Lock()
+
+    def __init__(self):
+        self.traced = tracemalloc.is_tracing()
+        if not self.traced:
+            self.start = self.peak = peak_rss()
+            return
+        with self.lock:
+            current, peak = tracemalloc.get_traced_memory()
+            for mark in self.open_marks:
+                mark.peak = max(mark.peak, peak)
+            tracemalloc.reset_peak()
+            self.start = self.peak = current
+            self.open_marks.append(self)
+
+    def peak_bytes(self):
+        """
+        Return how many bytes more than at the mark were in use at the
+        peak since, or None if it can't be found. Closes the mark.
+        """
+        if not self.traced:
+            peak = peak_rss()
+            return None if peak is None else peak - self.start
+        with self.lock:
+            if self in self.open_marks:
+                self.open_marks.remove(self)
+            if tracemalloc.is_tracing():
+                self.peak = max(
+                    self.peak, tracemalloc.get_traced_memory()[1])
+        return self.peak - self.start
+
+
+def record_phase(report, name):
+    """
+    Return context manager which records phase in report (see
+    Report.phase), or which does nothing if report is None.
+    """
+    if report is None:
+        return nullcontext({})
+    return report.phase(name)
+
+
+class Report:
+    """
+    Report of the time taken, number of items processed and peak memory
+    use (above what was in use when it started, see MemoryMark) of each
+    phase of an operation (e.g. importing a chat).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.phases = {}
+        self.samples = {}
+
+    @contextmanager
+    def phase(self, name, items=None):
+        """
+        Return context manager which records phase, yielding dict of the
+        phase whose items can be set once they're known.
+        """
+        phase = {'seconds': None, 'items': items, 'peak_bytes': None}
+        mark = MemoryMark()
+        start = time.perf_counter()
+        try:
+            yield phase
+        finally:
+            phase['seconds'] = time.perf_counter() - start
+            phase['peak_bytes'] = mark.peak_bytes()
+            self.phases[name] = phase
+
+    def sample(self, name, seconds):
+        """Record time taken by a sampled per message phase."""
+        total, count = self.samples.get(name, (0, 0))
+        self.samples[name] = (total + seconds, count + 1)
+
+    def as_dict(self):
+        """Return report as dict."""
+        phases = dict(self.phases)
+        # Sampled phases are scaled up to estimate the total
+        for name, (seconds, count) in self.samples.items():
+            phases[name] = {
+                'seconds': seconds * SAMPLE_INTERVAL,
+                'items': count * SAMPLE_INTERVAL,
+                'peak_bytes': None,
+                'estimated': True,
+            }
+        return {'name': self.name, 'phases': phases}
+
+    def log(self):
+        """Log report."""
+        logger.info('%s', self)
+
+    def dump(self, path):
+        """Append report as a line of JSON to file at path."""
+        with open(str(path), 'a', encoding='utf-8') as report_obj:
+            report_obj.write(json.dumps(self.as_dict()) + '\n')
+
+    def publish(self):
+        """Log report and dump it to REPORT_PATH if it's set."""
+        self.log()
+        if REPORT_PATH:
+            try:
+                self.dump(REPORT_PATH)
+            except OSError:
+                logger.warning('Couldn\'t write report to %s', REPORT_PATH)
+
+    def __str__(self):
+        lines = [self.name]
+        for name, phase in self.as_dict()['phases'].items():
+            items = '' if phase['items'] is None else '{:,}'.format(
+                phase['items'])
+            peak = '' if phase['peak_bytes'] is None else '{:,.1f} MB'.format(
+                phase['peak_bytes'] / 2**20)
+            estimated = ' (estimated)' if phase.get('estimated') else ''
+            lines.append('  {:<20} {:>9.3f} s {:>12} {:>11}{}'.format(
+                name, phase['seconds'], items, peak, estimated))
+        return '\n'.join(lines)
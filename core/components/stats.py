@@ -1,14 +1,30 @@
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+
+from .store import (EPOCH, SECONDS_PER_DAY, TYPES, attachment_name,
+                    attachment_type, date_range)
+
+
+def in_date_range(messages, start_date, end_date):
+    """Return mask of messages sent between start and end date."""
+    start, end = date_range(start_date, end_date)
+    timestamps = messages.timestamps
+    return (timestamps >= start) & (timestamps < end)
+
+
 def messages_sent(message_container, start_date, end_date, message_type=None):
     """
     Return number of messages sent between start and end date contained
     by message container (chat/member).
     """
-    messages_sent = 0
-    for message in message_container.messages:
-        if (start_date <= message.timestamp.date() <= end_date
-           and (message_type is None or message.type == message_type)):
-                messages_sent += 1
-    return messages_sent
+    messages = message_container.messages
+    mask = in_date_range(messages, start_date, end_date)
+    if message_type is not None:
+        code = messages.store.type_codes.get(message_type)
+        mask &= messages.type_ids == code
+    return int(mask.sum())
 
 
 def words_sent(message_container, start_date, end_date):
@@ -16,9 +32,335 @@ def words_sent(message_container, start_date, end_date):
     Return number of words sent between start and end date contained by
     message container (chat/member).
     """
-    words_sent = 0
-    for message in message_container.messages:
-        if (start_date <= message.timestamp.date() <= end_date
-           and message.type == 'text'):
-                words_sent += len(message.words())
-    return words_sent
+    messages = message_container.messages
+    mask = in_date_range(messages, start_date, end_date)
+    return int(messages.word_counts[mask].sum())
+
+
+def message_counts(store):
+    """Return array of 1 for each message in store."""
+    return np.ones(len(store), dtype=np.int64)
+
+
+def word_counts(store):
+    """Return array of number of words in each message in store."""
+    return store.word_counts
+
+
+def character_counts(store):
+    """Return array of number of characters in each text in store."""
+    lengths = store.contents.lengths()
+    return np.where(store.type_ids == store.type_codes['text'], lengths, 0)
+
+
+def type_counts(message_type):
+    """
+    Return function which returns array of 1 for each message of message
+    type in a store and 0 for every other message.
+    """
+    def counts(store):
+        return store.type_ids == store.type_codes.get(message_type)
+    return counts
+
+
+# Metrics which can be aggregated over each member's messages, given by
+# functions which return an array of the value of the metric for each
+# message in a store. Any other message type can be counted too.
+METRICS = {
+    'messages': message_counts,
+    'words': word_counts,
+    'characters': character_counts,
+}
+for message_type in TYPES:
+    METRICS[message_type] = type_counts(message_type)
+
+
+# Periods which activity can be binned by
+PERIODS = ['day', 'week', 'month']
+DAYS_PER_WEEK = 7
+HOURS_PER_DAY = 24
+# The epoch was a Thursday, so days since it are shifted by this many to
+# make weeks start on Mondays
+WEEK_OFFSET = 3
+
+# Conversations are split wherever nobody sends a message for longer
+# than this many seconds, and a message sent after such a gap is the start
+# of a new conversation rather than a reply
+SESSION_GAP = 60 * 60
+
+
+def period_index(days, period):
+    """
+    Return array of the index (since the epoch) of the period which each
+    of array of days (since the epoch) is in.
+    """
+    if period == 'day':
+        return days
+    elif period == 'week':
+        return (days + WEEK_OFFSET) // DAYS_PER_WEEK
+    elif period == 'month':
+        months = days.astype('datetime64[D]').astype('datetime64[M]')
+        return months.astype(np.int64)
+    raise ValueError('Unknown period {!r}.'.format(period))
+
+
+def period_start(index, period):
+    """Return date of the first day of period with index (since the epoch)."""
+    if period == 'day':
+        return EPOCH.date() + timedelta(days=index)
+    elif period == 'week':
+        return EPOCH.date() + timedelta(
+            days=index * DAYS_PER_WEEK - WEEK_OFFSET)
+    elif period == 'month':
+        return date(EPOCH.year + index // 12, index % 12 + 1, 1)
+    raise ValueError('Unknown period {!r}.'.format(period))
+
+
+def prefix_sum(values):
+    """Return array of sums of the first i values for i = 0, ..., n."""
+    sums = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(values, out=sums[1:])
+    return sums
+
+
+class DateIndex:
+    """
+    Index of a chat's messages sorted by sender and then timestamp, along
+    with prefix sums of each metric, so that every metric for every
+    member between any two dates can be found with two binary searches
+    per member.
+    """
+
+    def __init__(self, store, member_count):
+        self.store = store
+        self.order = np.lexsort((store.timestamps, store.senders))
+        self.timestamps = store.timestamps[self.order]
+        # Messages sent by member i are at positions bounds[i] to
+        # bounds[i + 1]
+        self.bounds = np.searchsorted(
+            store.senders[self.order], np.arange(member_count + 1))
+        self.sums = {}
+        self.lock = threading.Lock()
+
+    def metric_sum(self, metric):
+        """
+        Return prefix sums of metric (which are built when needed, by one
+        thread at a time).
+        """
+        with self.lock:
+            if metric not in self.sums:
+                values = METRICS.get(metric, type_counts(metric))(self.store)
+                self.sums[metric] = prefix_sum(values[self.order])
+            return self.sums[metric]
+
+    def search(self, start_date, end_date):
+        """
+        Return (first, last) arrays of the positions of the first message
+        sent by each member between start and end date, and of the first
+        message after it.
+        """
+        start, end = date_range(start_date, end_date)
+        first = np.empty(len(self.bounds) - 1, dtype=np.int64)
+        last = np.empty(len(self.bounds) - 1, dtype=np.int64)
+        for i, (lo, hi) in enumerate(zip(self.bounds, self.bounds[1:])):
+            timestamps = self.timestamps[lo:hi]
+            first[i] = lo + np.searchsorted(timestamps, start)
+            last[i] = lo + np.searchsorted(timestamps, end)
+        return first, last
+
+    def aggregate(self, start_date, end_date, metrics=None):
+        """
+        Return dict of array of the total of each metric for each member
+        between start and end date, for every metric in METRICS if
+        metrics isn't given.
+        """
+        first, last = self.search(start_date, end_date)
+        totals = {}
+        for metric in METRICS if metrics is None else metrics:
+            if metric == 'messages':
+                totals[metric] = last - first
+            else:
+                sums = self.metric_sum(metric)
+                totals[metric] = sums[last] - sums[first]
+        return totals
+
+    def select(self, start_date, end_date):
+        """
+        Return (timestamps, senders) arrays of every message sent between
+        start and end date, grouped by sender.
+        """
+        first, last = self.search(start_date, end_date)
+        # Nothing is selected if end date is before start date
+        last = np.maximum(first, last)
+        timestamps = np.concatenate([
+            self.timestamps[lo:hi] for lo, hi in zip(first, last)])
+        senders = np.repeat(np.arange(len(first)), last - first)
+        return timestamps, senders
+
+    def activity(self, start_date, end_date, period):
+        """
+        Return (starts, counts) where starts is a list of the first day of
+        each period (day/week/month) from the one containing start date
+        to the one containing end date, and counts is an array of the
+        number of messages each member sent in each period.
+        """
+        timestamps, senders = self.select(start_date, end_date)
+        first, last = period_index(np.array([
+            (start_date - EPOCH.date()).days,
+            (end_date - EPOCH.date()).days,
+        ]), period)
+        periods = max(last - first + 1, 0)
+        bins = period_index(timestamps // SECONDS_PER_DAY, period) - first
+        member_count = len(self.bounds) - 1
+        counts = np.bincount(senders * periods + bins,
+                             minlength=member_count * periods)
+        starts = [period_start(int(index), period)
+                  for index in range(first, last + 1)]
+        return starts, counts.reshape(member_count, periods)
+
+    def heatmap(self, start_date, end_date):
+        """
+        Return array of the number of messages sent between start and end
+        date in each hour (columns) of each day of the week (rows,
+        starting on Monday).
+        """
+        timestamps, _ = self.select(start_date, end_date)
+        days, seconds = np.divmod(timestamps, SECONDS_PER_DAY)
+        weekdays = (days + WEEK_OFFSET) % DAYS_PER_WEEK
+        hours = seconds // (SECONDS_PER_DAY // HOURS_PER_DAY)
+        counts = np.bincount(weekdays * HOURS_PER_DAY + hours,
+                             minlength=DAYS_PER_WEEK * HOURS_PER_DAY)
+        return counts.reshape(DAYS_PER_WEEK, HOURS_PER_DAY)
+
+    def chronological(self, start_date, end_date):
+        """
+        Return (timestamps, senders) arrays of every message sent between
+        start and end date, in the order they were sent.
+        """
+        store = self.store
+        mask = in_date_range(store, start_date, end_date)
+        return store.timestamps[mask], store.senders[mask]
+
+    def replies(self, start_date, end_date, gap=SESSION_GAP):
+        """
+        Return (repliers, repliees, latencies) arrays of the sender of
+        each reply sent between start and end date, the sender of the
+        message it replied to and the number of seconds between them. A
+        reply is a message which follows one sent by someone else at most
+        gap seconds before.
+        """
+        timestamps, senders = self.chronological(start_date, end_date)
+        replies = np.flatnonzero(senders[1:] != senders[:-1]) + 1
+        latencies = timestamps[replies] - timestamps[replies - 1]
+        replied = latencies <= gap
+        replies = replies[replied]
+        # Messages can be out of order by a few seconds in chat logs
+        latencies = np.maximum(latencies[replied], 0)
+        return senders[replies], senders[replies - 1], latencies
+
+    def reply_counts(self, start_date, end_date, gap=SESSION_GAP):
+        """
+        Return array of the number of times each member (rows) replied to
+        each member (columns) between start and end date (see replies).
+        """
+        repliers, repliees, _ = self.replies(start_date, end_date, gap)
+        member_count = len(self.bounds) - 1
+        counts = np.bincount(repliers * member_count + repliees,
+                             minlength=member_count * member_count)
+        return counts.reshape(member_count, member_count)
+
+    def reply_times(self, start_date, end_date, gap=SESSION_GAP):
+        """
+        Return (medians, counts) arrays of the median number of seconds
+        each member took to reply between start and end date (nan if they
+        didn't) and the number of replies they sent (see replies).
+        """
+        repliers, _, latencies = self.replies(start_date, end_date, gap)
+        member_count = len(self.bounds) - 1
+        # Replies are sorted by replier and then latency so that each
+        # member's median is in the middle of their replies
+        order = np.lexsort((latencies, repliers))
+        latencies = latencies[order]
+        bounds = np.searchsorted(
+            repliers[order], np.arange(member_count + 1))
+        counts = np.diff(bounds)
+        replied = counts > 0
+        lower = (bounds[:-1] + (counts - 1) // 2)[replied]
+        upper = (bounds[:-1] + counts // 2)[replied]
+        medians = np.full(member_count, np.nan)
+        medians[replied] = (latencies[lower] + latencies[upper]) / 2
+        return medians, counts
+
+    def sessions(self, start_date, end_date, gap=SESSION_GAP):
+        """
+        Return (starters, lengths, durations) arrays of the member who
+        started each conversation between start and end date, the number
+        of messages in it and the number of seconds it lasted, where
+        conversations are split by gaps of more than gap seconds.
+        """
+        timestamps, senders = self.chronological(start_date, end_date)
+        if not len(timestamps):
+            empty = np.empty(0, dtype=np.int64)
+            return senders, empty, empty
+        starts = np.flatnonzero(np.diff(timestamps) > gap) + 1
+        starts = np.concatenate([[0], starts])
+        ends = np.append(starts[1:], len(timestamps))
+        return (senders[starts], ends - starts,
+                timestamps[ends - 1] - timestamps[starts])
+
+
+class MediaIndex:
+    """
+    Index of the messages in a store which have attachments, along with
+    the sizes of their files in the chat log zip, so that the volume of
+    media each member sent between any two dates can be found without
+    reading the contents of the messages again or extracting the
+    attachments.
+    """
+
+    def __init__(self, store, attachment_sizes):
+        """
+        Arguments:
+        store - messages of chat (store.MessageStore)
+        attachment_sizes - dict of the size in bytes of each file in the
+                           chat log zip by name (see
+                           archive.attachment_sizes)
+        """
+        self.store = store
+        self.attachment_sizes = attachment_sizes
+        self.size = len(store)
+        positions = []
+        type_ids = []
+        sizes = []
+        # Only the messages which may have attachments are decoded
+        candidates = store.contents.find('attached')
+        candidates = candidates[candidates < self.size].tolist()
+        for position in candidates:
+            name = attachment_name(store.contents[position])
+            if name is not None:
+                positions.append(position)
+                type_ids.append(store.type_code(attachment_type(name)))
+                # Attachments which weren't exported with the chat log
+                # are counted but have no size
+                sizes.append(attachment_sizes.get(name, 0))
+        positions = np.array(positions, dtype=np.int64)
+        self.timestamps = store.timestamps[positions]
+        self.senders = store.senders[positions]
+        self.type_ids = np.array(type_ids, dtype=np.int64)
+        self.sizes = np.array(sizes, dtype=np.int64)
+
+    def volume(self, start_date, end_date, member_count):
+        """
+        Return (sizes, counts) arrays of the total size in bytes and the
+        number of the attachments of each type (columns, see
+        MessageStore.types) which each member (rows) sent between start
+        and end date.
+        """
+        start, end = date_range(start_date, end_date)
+        mask = (self.timestamps >= start) & (self.timestamps < end)
+        type_count = len(self.store.types)
+        bins = self.senders[mask] * type_count + self.type_ids[mask]
+        shape = (member_count, type_count)
+        sizes = np.bincount(bins, self.sizes[mask], member_count * type_count)
+        counts = np.bincount(bins, minlength=member_count * type_count)
+        return sizes.astype(np.int64).reshape(shape), counts.reshape(shape)
@@ -0,0 +1,621 @@
+import re
+import threading
+from array import array
+from datetime import datetime, timedelta
+from pathlib import PurePosixPath
+
+import numpy as np
+
+EPOCH = datetime(1970, 1, 1)
+SECONDS_PER_DAY = 86400
+
+TYPES = ['text', 'image', 'video', 'gif', 'document', 'location', 'contact']
+# Number of contents whose spans are read at once when they're decoded
+DECODE_BATCH_SIZE = 10000
+# Number of bytes of contents whose characters are counted at once
+LENGTH_BLOCK_SIZE = 2**20
+
+# Chat logs exported with media say which file in the zip is attached to
+# a message, as <attached: name> on iOS and as name (file attached) at the
+# start of the message on Android
+IOS_ATTACHMENT_REGEX = re.compile(r'<attached: ([^>\n]+)>')
+ANDROID_ATTACHMENT_REGEX = re.compile(r'([^\n]+\.\w+) \(file attached\)')
+# Types of attachments found from the names WhatsApp gives their files,
+# e.g. 00000012-PHOTO-2019-03-12-21-41-02.jpg on iOS and
+# IMG-20190312-WA0001.jpg on Android, otherwise from their extensions
+ATTACHMENT_TYPES = {
+    'PHOTO': 'image',
+    'IMG': 'image',
+    'VIDEO': 'video',
+    'VID': 'video',
+    'GIF': 'gif',
+    'AUDIO': 'audio',
+    'PTT': 'audio',
+    'AUD': 'audio',
+    'STICKER': 'sticker',
+    'STK': 'sticker',
+    'DOC': 'document',
+}
+EXTENSION_TYPES = {
+    '.jpg': 'image',
+    '.jpeg': 'image',
+    '.png': 'image',
+    '.heic': 'image',
+    '.mp4': 'video',
+    '.mov': 'video',
+    '.gif': 'gif',
+    '.opus': 'audio',
+    '.m4a': 'audio',
+    '.mp3': 'audio',
+    '.webp': 'sticker',
+    '.vcf': 'contact',
+}
+
+
+def to_epoch(timestamp):
+    """Return number of seconds between epoch and (naive) datetime."""
+    return (timestamp - EPOCH) // timedelta(seconds=1)
+
+
+def from_epoch(seconds):
+    """Return (naive) datetime which is seconds after epoch."""
+    return EPOCH + timedelta(seconds=int(seconds))
+
+
+def day_start(day):
+    """Return number of seconds between epoch and start of date."""
+    return (day - EPOCH.date()).days * SECONDS_PER_DAY
+
+
+def date_range(start_date, end_date):
+    """
+    Return (start, end) epoch seconds of the half open interval which
+    covers every second from the start of start date to the end of end
+    date.
+    """
+    return day_start(start_date), day_start(end_date) + SECONDS_PER_DAY
+
+
+def attachment_name(content):
+    """Return name of file attached to message with content, or None."""
+    # Checked first since most messages aren't attachments
+    if 'attached' not in content:
+        return None
+    match = (IOS_ATTACHMENT_REGEX.search(content)
+             or ANDROID_ATTACHMENT_REGEX.match(content))
+    return match.group(1) if match else None
+
+
+def attachment_type(name):
+    """Return the type of attachment with file name."""
+    for part in name.split('-', 2)[:2]:
+        if part in ATTACHMENT_TYPES:
+            return ATTACHMENT_TYPES[part]
+    return EXTENSION_TYPES.get(PurePosixPath(name).suffix.lower(), 'document')
+
+
+def get_type(content):
+    """Return the type of a message based on its content."""
+    name = attachment_name(content)
+    if name is not None:
+        return attachment_type(name)
+    # Non text messages contain the character \u200e which is
+    # followed by the type of the message
+    match = re.search(r'\u200e(\w+)', content)
+    if match:
+        return match.group(1).lower()
+    # Chat logs exported from Android don't say what type media is
+    if content == '<Media omitted>':
+        return 'media'
+    return 'text'
+
+
+class ContentColumn:
+    """
+    Sequence of the contents of a store's messages, which are kept as
+    spans of UTF-8 bytes in shared buffers (e.g. the memory mapped chat
+    log or cache entry) rather than as a string for each message, and are
+    only decoded into strings when they're read.
+
+    Messages are kept in segments of consecutive messages whose contents
+    are in the same buffer. Contents which are appended as strings are
+    encoded into a buffer of the column's own.
+    """
+
+    def __init__(self):
+        self.buffers = []
+        # Position of the first message of each segment
+        self.firsts = []
+        self.starts = np.empty(0, dtype=np.int64)
+        self.ends = np.empty(0, dtype=np.int64)
+        self.own_buffer = None
+        self.init_buffers()
+
+    def init_buffers(self):
+        """Create empty buffers for spans which are yet to be added."""
+        self.start_buffer = array('q')
+        self.end_buffer = array('q')
+
+    def attach(self, buffer, starts=None, ends=None):
+        """
+        Start a segment of messages whose contents are spans of buffer,
+        which are appended as (start, end) pairs or given as arrays of
+        starts and ends.
+        """
+        self.finalise()
+        if not self.buffers or self.buffers[-1] is not buffer:
+            self.buffers.append(buffer)
+            self.firsts.append(len(self))
+        if starts is not None and not len(self.starts):
+            # Spans of the first segment (e.g. of a memory mapped cache
+            # entry) aren't copied
+            self.starts, self.ends = starts, ends
+        elif starts is not None:
+            self.starts = np.concatenate([self.starts, starts])
+            self.ends = np.concatenate([self.ends, ends])
+
+    def append(self, content):
+        """Add content, given as a string or a span of the last buffer."""
+        if isinstance(content, str):
+            own_buffer = self.own_buffer
+            if own_buffer is None or self.buffers[-1] is not own_buffer:
+                own_buffer = self.own_buffer = bytearray()
+                self.attach(own_buffer)
+            start = len(own_buffer)
+            own_buffer += content.encode('utf-8')
+            content = start, len(own_buffer)
+        start, end = content
+        self.start_buffer.append(start)
+        self.end_buffer.append(end)
+
+    def append_spans(self, starts, ends):
+        """
+        Add contents given as arrays (array.array) of the starts and ends
+        of spans of the last buffer.
+        """
+        self.start_buffer.extend(starts)
+        self.end_buffer.extend(ends)
+
+    def finalise(self):
+        """Move spans which have been appended into the arrays."""
+        if not self.start_buffer:
+            return
+        self.starts = np.concatenate(
+            [self.starts, np.frombuffer(self.start_buffer, np.int64)])
+        self.ends = np.concatenate(
+            [self.ends, np.frombuffer(self.end_buffer, np.int64)])
+        self.init_buffers()
+
+    def extend(self, other):
+        """Add contents of other column to this one."""
+        self.finalise()
+        other.finalise()
+        for i, buffer in enumerate(other.buffers):
+            first = other.firsts[i]
+            last = (other.firsts[i + 1] if i + 1 < len(other.buffers)
+                    else len(other))
+            self.attach(buffer, other.starts[first:last],
+                        other.ends[first:last])
+
+    def copy(self):
+        """
+        Return copy of column which shares its buffers and spans, but which
+        contents can be added to without changing this column.
+        """
+        self.finalise()
+        column = ContentColumn()
+        column.buffers = [*self.buffers]
+        column.firsts = [*self.firsts]
+        column.starts, column.ends = self.starts, self.ends
+        return column
+
+    def detach(self):
+        """
+        Drop buffers (e.g. before the column is sent back to a process
+        which already has them), leaving the spans in them. See rebase.
+        """
+        self.finalise()
+        self.buffers = [None] * len(self.buffers)
+
+    def rebase(self, buffer, offset):
+        """
+        Point every segment of detached column at buffer, in which the
+        buffer they were detached from starts at offset.
+        """
+        self.starts += offset
+        self.ends += offset
+        self.buffers = [buffer] * len(self.buffers)
+
+    def segments(self, start=0, stop=None):
+        """
+        Return iterator which iterates over (first, last, buffer) of the
+        part of each segment from position start to stop.
+        """
+        self.finalise()
+        stop = len(self) if stop is None else stop
+        bounds = self.firsts[1:] + [len(self)]
+        for first, last, buffer in zip(self.firsts, bounds, self.buffers):
+            first, last = max(first, start), min(last, stop)
+            if first < last:
+                yield first, last, buffer
+
+    def decode(self, start=0, stop=None):
+        """
+        Return iterator which iterates over the contents of the messages
+        from position start to stop, decoded into strings.
+        """
+        for first, last, buffer in self.segments(start, stop):
+            # Spans are turned into lists in batches so that they don't
+            # take up more memory than the contents
+            for batch in range(first, last, DECODE_BATCH_SIZE):
+                batch_end = min(batch + DECODE_BATCH_SIZE, last)
+                for span_start, span_end in zip(
+                        self.starts[batch:batch_end].tolist(),
+                        self.ends[batch:batch_end].tolist()):
+                    yield str(buffer[span_start:span_end], 'utf-8')
+
+    def write(self, file_obj):
+        """
+        Write the bytes of every content, one after another, to file
+        object (opened in binary mode) without decoding or joining them.
+        Spans are read in batches, and runs of contents which follow each
+        other in their buffer are written at once.
+        """
+        for first, last, buffer in self.segments():
+            with memoryview(buffer) as view:
+                for batch in range(first, last, DECODE_BATCH_SIZE):
+                    batch_end = min(batch + DECODE_BATCH_SIZE, last)
+                    starts = self.starts[batch:batch_end]
+                    ends = self.ends[batch:batch_end]
+                    # A run ends wherever the next content doesn't start
+                    # where it ends
+                    breaks = np.flatnonzero(starts[1:] != ends[:-1])
+                    run_starts = starts[np.concatenate([[0], breaks + 1])]
+                    run_ends = ends[np.concatenate([breaks, [len(ends) - 1]])]
+                    for start, end in zip(run_starts.tolist(),
+                                          run_ends.tolist()):
+                        file_obj.write(view[start:end])
+
+    def find(self, text):
+        """
+        Return array of the positions of the messages whose contents may
+        contain text, found by searching the buffers for it rather than
+        decoding every content. These are the contents which contain it,
+        along with any which it runs into from the content before.
+        """
+        needle = text.encode('utf-8')
+        pattern = re.compile(re.escape(needle))
+        positions = []
+        for first, last, buffer in self.segments():
+            starts = self.starts[first:last]
+            ends = self.ends[first:last]
+            # Spans of a segment are in the order of the buffer, which
+            # may contain more than the contents (e.g. the senders)
+            matches = np.fromiter(
+                (match.start() for match in pattern.finditer(
+                    buffer, int(starts[0]), int(ends[-1]))),
+                np.int64)
+            # Contents which the first or last byte of a match are in
+            points = np.concatenate(
+                [matches, matches + len(needle) - 1])
+            spans = np.searchsorted(starts, points, 'right') - 1
+            found = (spans >= 0) & (points < ends[np.maximum(spans, 0)])
+            positions.append(spans[found] + first)
+        if not positions:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(positions))
+
+    def lengths(self):
+        """
+        Return array of the number of characters in each content, which
+        are counted from the bytes of the contents rather than by decoding
+        them.
+        """
+        self.finalise()
+        lengths = self.ends - self.starts
+        for first, last, buffer in self.segments():
+            data = np.frombuffer(buffer, np.uint8)
+            # Starts and ends of the spans, in the order of the buffer
+            points = np.column_stack(
+                [self.starts[first:last], self.ends[first:last]]).ravel()
+            # Number of continuation bytes (10xxxxxx) between the first
+            # point and each point, which the buffer is read in blocks for
+            counts = np.zeros(len(points), dtype=np.int64)
+            total = 0
+            for block in range(int(points[0]), int(points[-1]),
+                               LENGTH_BLOCK_SIZE):
+                block_end = min(block + LENGTH_BLOCK_SIZE, int(points[-1]))
+                # Continuation bytes are the only ones below -64 as int8
+                continued = np.flatnonzero(
+                    data[block:block_end].view(np.int8) < -64)
+                lo, hi = np.searchsorted(points, [block, block_end], 'right')
+                counts[lo:hi] = total + np.searchsorted(
+                    continued, points[lo:hi] - block)
+                total += len(continued)
+            lengths[first:last] -= counts[1::2] - counts[::2]
+        return lengths
+
+    def __len__(self):
+        return len(self.starts) + len(self.start_buffer)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step == 1:
+                return list(self.decode(start, max(start, stop)))
+            return [self[j] for j in range(start, stop, step)]
+        if i < 0:
+            i += len(self)
+        for _, _, buffer in self.segments(i, i + 1):
+            return str(buffer[self.starts[i]:self.ends[i]], 'utf-8')
+        raise IndexError('content index out of range')
+
+    def __iter__(self):
+        return self.decode()
+
+
+class MessageStore:
+    """
+    Columnar store which holds every message of a chat as parallel
+    arrays of epoch timestamps, sender ids, type codes, word counts and
+    contents (see ContentColumn).
+
+    Messages are appended to growable buffers while the chat log is
+    parsed and then moved into NumPy arrays by finalise. Type codes and
+    word counts are only found from the contents of the messages when
+    they're first needed, whilst holding lock so that statistics which
+    are computed in different threads don't find them twice.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.types = [*TYPES]
+        self.type_codes = {name: code for code, name in enumerate(TYPES)}
+        self.timestamps = np.empty(0, dtype=np.int64)
+        self.senders = np.empty(0, dtype=np.int32)
+        self._type_ids = np.empty(0, dtype=np.int16)
+        self._word_counts = np.empty(0, dtype=np.int32)
+        self.contents = ContentColumn()
+        self.init_buffers()
+
+    def init_buffers(self):
+        """Create empty buffers for messages which are yet to be added."""
+        self.timestamp_buffer = array('q')
+        self.sender_buffer = array('i')
+
+    @property
+    def type_ids(self):
+        """Array of the type code of each message."""
+        with self.lock:
+            start = len(self._type_ids)
+            if start < len(self):
+                type_ids = np.fromiter(
+                    (self.type_code(get_type(content))
+                     for content in self.contents.decode(start, len(self))),
+                    np.int16, len(self) - start)
+                self._type_ids = np.concatenate([self._type_ids, type_ids])
+            return self._type_ids
+
+    @type_ids.setter
+    def type_ids(self, type_ids):
+        self._type_ids = type_ids
+
+    @property
+    def word_counts(self):
+        """Array of the number of words in each message (0 if not text)."""
+        with self.lock:
+            start = len(self._word_counts)
+            if start < len(self):
+                text = self.type_codes['text']
+                type_ids = self.type_ids[start:].tolist()
+                contents = self.contents.decode(start, len(self))
+                word_counts = np.fromiter(
+                    (len(content.split()) if type_id == text else 0
+                     for content, type_id in zip(contents, type_ids)),
+                    np.int32, len(self) - start)
+                self._word_counts = np.concatenate(
+                    [self._word_counts, word_counts])
+            return self._word_counts
+
+    @word_counts.setter
+    def word_counts(self, word_counts):
+        self._word_counts = word_counts
+
+    def type_code(self, message_type):
+        """Return code of message type, adding it if it's not known."""
+        code = self.type_codes.get(message_type)
+        if code is None:
+            code = self.type_codes[message_type] = len(self.types)
+            self.types.append(message_type)
+        return code
+
+    def append(self, timestamp, sender_id, content):
+        """
+        Add message with epoch timestamp, sender id and content (see
+        ContentColumn.append) to store.
+        """
+        self.timestamp_buffer.append(timestamp)
+        self.sender_buffer.append(sender_id)
+        self.contents.append(content)
+
+    def append_spans(self, timestamps, sender_ids, starts, ends):
+        """
+        Add messages given as arrays of epoch timestamps (which may be a
+        NumPy array), sender ids and the starts and ends of their contents
+        in the last buffer (see ContentColumn.append_spans) to store.
+        """
+        self.timestamp_buffer.frombytes(
+            np.asarray(timestamps, dtype=np.int64).tobytes())
+        self.sender_buffer.extend(sender_ids)
+        self.contents.append_spans(starts, ends)
+
+    def finalise(self):
+        """Move messages which have been appended into the arrays."""
+        if not self.timestamp_buffer:
+            return
+        self.contents.finalise()
+        self.timestamps = np.concatenate(
+            [self.timestamps, np.frombuffer(self.timestamp_buffer, np.int64)])
+        self.senders = np.concatenate(
+            [self.senders, np.frombuffer(self.sender_buffer, np.int32)])
+        self.init_buffers()
+
+    def extend(self, other, sender_ids):
+        """
+        Add messages of other store to this one, where sender_ids maps
+        the sender ids of the other store to ones of this store.
+        """
+        self.finalise()
+        other.finalise()
+        # Type codes and word counts which have already been found for
+        # the other store are kept, as long as they have been for this one
+        if len(other._type_ids) and len(self._type_ids) == len(self):
+            type_ids = np.array(
+                [self.type_code(message_type) for message_type in other.types],
+                dtype=np.int16)
+            self._type_ids = np.concatenate(
+                [self._type_ids, type_ids[other._type_ids]])
+        if len(other._word_counts) and len(self._word_counts) == len(self):
+            self._word_counts = np.concatenate(
+                [self._word_counts, other._word_counts])
+        self.timestamps = np.concatenate([self.timestamps, other.timestamps])
+        self.senders = np.concatenate(
+            [self.senders, sender_ids[other.senders]])
+        self.contents.extend(other.contents)
+
+    def copy(self):
+        """
+        Return copy of store which shares its arrays and the buffers of its
+        contents, but which messages can be added to without changing this
+        store.
+        """
+        with self.lock:
+            self.finalise()
+            store = MessageStore()
+            store.types = [*self.types]
+            store.type_codes = {**self.type_codes}
+            store.timestamps, store.senders = self.timestamps, self.senders
+            store._type_ids = self._type_ids
+            store._word_counts = self._word_counts
+            store.contents = self.contents.copy()
+        return store
+
+    def __getstate__(self):
+        # Locks can't be pickled, so stores which are sent between
+        # processes get a new one
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+
+    def sender_indices(self, sender_count):
+        """
+        Return list of arrays where the ith array contains the positions
+        of the messages sent by sender id i, in chronological order.
+        """
+        order = np.argsort(self.senders, kind='stable')
+        counts = np.bincount(self.senders, minlength=sender_count)
+        return np.split(order, np.cumsum(counts)[:-1])
+
+    def __len__(self):
+        return len(self.timestamps)
+
+
+class MessageView:
+    """
+    Sequence of the messages in a store at an array of positions (or
+    every message in the store if positions is None), whose senders are
+    the members of a chat.
+    """
+
+    def __init__(self, store, members, positions=None):
+        self.store = store
+        self.members = members
+        self.positions = positions
+
+    def column(self, values):
+        """Return values of column at the positions in view."""
+        return values if self.positions is None else values[self.positions]
+
+    @property
+    def timestamps(self):
+        return self.column(self.store.timestamps)
+
+    @property
+    def senders(self):
+        return self.column(self.store.senders)
+
+    @property
+    def type_ids(self):
+        return self.column(self.store.type_ids)
+
+    @property
+    def word_counts(self):
+        return self.column(self.store.word_counts)
+
+    def __len__(self):
+        if self.positions is None:
+            return len(self.store)
+        return len(self.positions)
+
+    def __getitem__(self, i):
+        if self.positions is not None:
+            i = self.positions[i]
+        elif i < 0:
+            i += len(self.store)
+        store = self.store
+        return Message(
+            from_epoch(store.timestamps[i]),
+            self.members[store.senders[i]].name,
+            store.contents[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class Message:
+    """
+    Message object which holds the message's timestamp and content. The
+    type and word count of the message are found from its content when
+    they're first needed.
+
+    Types: text, image, video, gif, document, location, contact (and
+    audio, sticker and media when they're known)
+    """
+
+    __slots__ = ['timestamp', 'sender', 'content', '_type', '_word_count']
+
+    def __init__(self, timestamp, sender, content):
+        self.timestamp = timestamp
+        self.sender = sender
+        self.content = content
+        self._type = None
+        self._word_count = None
+
+    @property
+    def type(self):
+        if self._type is None:
+            self._type = get_type(self.content)
+        return self._type
+
+    @property
+    def word_count(self):
+        """Number of words in message if message is a text, otherwise 0."""
+        if self._word_count is None:
+            words = self.words()
+            self._word_count = 0 if words is None else len(words)
+        return self._word_count
+
+    def words(self):
+        """Return list of words in message if message is a text."""
+        return self.content.split() if self.type == 'text' else None
+
+    def __repr__(self):
+        return '{timestamp}: {sender}: {content}'.format(
+            timestamp=self.timestamp,
+            sender=self.sender,
+            content=self.content)
@@ -0,0 +1,206 @@
+import re
+from datetime import date
+from functools import lru_cache
+
+import numpy as np
+
+from .store import day_start
+
+# Timestamps of chat logs exported from iOS are always in the form
+# dd/mm/yyyy, hh:mm:ss (as matched by formats.IOS), so fields can be
+# sliced out at fixed positions
+TIMESTAMP_LENGTH = 20
+SEPARATORS = {2: '/', 5: '/', 10: ',', 11: ' ', 14: ':', 17: ':'}
+DIGITS = [i for i in range(TIMESTAMP_LENGTH) if i not in SEPARATORS]
+# Chat logs exported from Android leave out seconds (as matched by
+# formats.ANDROID)
+SHORT_TIMESTAMP_LENGTH = 17
+# Timestamps of other formats vary in the number of digits, the order of
+# the day and month, the separators and whether they use the 12 hour clock
+VARIABLE_TIMESTAMP_REGEX = re.compile(
+    r'(\d{1,2})[/.](\d{1,2})[/.](\d{2}|\d{4}),? (\d{1,2}):(\d{2})'
+    r'(?::(\d{2}))?(?:\s?([AaPp])\.?\s?[Mm]\.?)?$')
+
+
+def malformed(timestamp, expected='dd/mm/yyyy, hh:mm:ss'):
+    """Return error for malformed timestamp."""
+    return ValueError(
+        'Malformed timestamp {!r}, expected {}.'.format(timestamp, expected))
+
+
+def is_number(text):
+    """
+    Return True if text is made up of the ASCII digits 0-9 alone, unlike
+    int, which also accepts signs, whitespace and other digits.
+    """
+    return text.isascii() and text.isdigit()
+
+
+@lru_cache(maxsize=4096)
+def decode_date(day):
+    """Return epoch seconds of start of day given as dd/mm/yyyy."""
+    # Thousands of messages are sent on the same day, so decoded days
+    # are cached
+    if (len(day) != 10 or day[2] + day[5] != '//'
+            or not is_number(day[:2] + day[3:5] + day[6:])):
+        raise malformed(day, 'dd/mm/yyyy')
+    try:
+        return day_start(date(int(day[6:]), int(day[3:5]), int(day[:2])))
+    except ValueError:
+        raise malformed(day, 'dd/mm/yyyy') from None
+
+
+def decode_timestamp(timestamp):
+    """
+    Return epoch seconds of timestamp given as dd/mm/yyyy, hh:mm:ss.
+
+    Gives the same result as parsing the timestamp with strptime and
+    raises ValueError if the timestamp is malformed, which (unlike for
+    strptime) it is if any field isn't written with ASCII digits alone.
+    """
+    if (len(timestamp) != TIMESTAMP_LENGTH
+            or timestamp[2] + timestamp[5] + timestamp[10:12]
+            + timestamp[14] + timestamp[17] != '//, ::'
+            or not is_number(timestamp[12:14] + timestamp[15:17]
+                             + timestamp[18:20])):
+        raise malformed(timestamp)
+    hours = int(timestamp[12:14])
+    minutes = int(timestamp[15:17])
+    seconds = int(timestamp[18:20])
+    if hours > 23 or minutes > 59 or seconds > 59:
+        raise malformed(timestamp)
+    try:
+        start = decode_date(timestamp[:10])
+    except ValueError:
+        raise malformed(timestamp) from None
+    return start + 3600 * hours + 60 * minutes + seconds
+
+
+def decode_short_timestamp(timestamp):
+    """
+    Return epoch seconds of timestamp given as dd/mm/yyyy, hh:mm, raising
+    ValueError if it's malformed.
+    """
+    if (len(timestamp) != SHORT_TIMESTAMP_LENGTH
+            or timestamp[2] + timestamp[5] + timestamp[10:12]
+            + timestamp[14] != '//, :'
+            or not is_number(timestamp[12:14] + timestamp[15:17])):
+        raise malformed(timestamp, 'dd/mm/yyyy, hh:mm')
+    hours = int(timestamp[12:14])
+    minutes = int(timestamp[15:17])
+    if hours > 23 or minutes > 59:
+        raise malformed(timestamp, 'dd/mm/yyyy, hh:mm')
+    try:
+        start = decode_date(timestamp[:10])
+    except ValueError:
+        raise malformed(timestamp, 'dd/mm/yyyy, hh:mm') from None
+    return start + 3600 * hours + 60 * minutes
+
+
+@lru_cache(maxsize=4096)
+def decode_day(year, month, day):
+    """Return epoch seconds of start of day."""
+    return day_start(date(year, month, day))
+
+
+def decode_variable_timestamp(timestamp, day_first=True):
+    """
+    Return epoch seconds of timestamp given as d/m/yy, h:mm (if day
+    first, otherwise m/d/yy, h:mm), where the year may have four digits,
+    the time may have seconds and the time may be on the 12 hour clock
+    (e.g. 9:41 pm), raising ValueError if it's malformed.
+    """
+    match = VARIABLE_TIMESTAMP_REGEX.match(timestamp)
+    expected = 'd/m/y, h:mm' if day_first else 'm/d/y, h:mm'
+    if match is None:
+        raise malformed(timestamp, expected)
+    first, second, year, hours, minutes, seconds, meridiem = match.groups()
+    day, month = (first, second) if day_first else (second, first)
+    year = int(year)
+    if year < 100:
+        year += 2000
+    hours = int(hours)
+    minutes = int(minutes)
+    seconds = int(seconds or 0)
+    if meridiem is not None:
+        if not 1 <= hours <= 12:
+            raise malformed(timestamp, expected)
+        hours = hours % 12 + (12 if meridiem in 'Pp' else 0)
+    if hours > 23 or minutes > 59 or seconds > 59:
+        raise malformed(timestamp, expected)
+    try:
+        start = decode_day(year, int(month), int(day))
+    except ValueError:
+        raise malformed(timestamp, expected) from None
+    return start + 3600 * hours + 60 * minutes + seconds
+
+
+def decode_timestamps(timestamps, short=False):
+    """
+    Return int64 array of epoch seconds of a list of timestamps given as
+    bytes in the form dd/mm/yyyy, hh:mm:ss (or dd/mm/yyyy, hh:mm if
+    short), decoded all at once.
+
+    Raises ValueError if any of the timestamps is malformed.
+    """
+    length = SHORT_TIMESTAMP_LENGTH if short else TIMESTAMP_LENGTH
+    if len(timestamps) == 0:
+        return np.empty(0, dtype=np.int64)
+    # One extra character is kept so that timestamps which are too long
+    # can be told apart from valid ones
+    width = length + 1
+    strings = np.array(timestamps, dtype='S{}'.format(width))
+    # View each timestamp as a row of character codes
+    codes = strings.view(np.uint8).reshape(len(strings), width)
+    valid = codes[:, length] == 0
+    for i, c in SEPARATORS.items():
+        if i < length:
+            valid &= codes[:, i] == ord(c)
+    digits = codes[:, [i for i in DIGITS if i < length]].astype(np.int64)
+    digits -= ord('0')
+    valid &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+
+    def field(start, end):
+        value = np.zeros(len(strings), dtype=np.int64)
+        for i in range(start, end):
+            value = 10 * value + digits[:, i]
+        return value
+
+    day, month, year = field(0, 2), field(2, 4), field(4, 8)
+    hours, minutes = field(8, 10), field(10, 12)
+    seconds = 0 if short else field(12, 14)
+    valid &= (hours <= 23) & (minutes <= 59) & (seconds <= 59)
+
+    def invalid(i):
+        timestamp = timestamps[i].decode('utf-8', 'replace')
+        if short:
+            return malformed(timestamp, 'dd/mm/yyyy, hh:mm')
+        return malformed(timestamp)
+
+    if not valid.all():
+        raise invalid(int(np.argmin(valid)))
+
+    # Decode each distinct day once
+    keys, inverse = np.unique(
+        10000 * year + 100 * month + day, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    starts = np.empty(len(keys), dtype=np.int64)
+    for i, key in enumerate(keys.tolist()):
+        try:
+            starts[i] = decode_date('{:02}/{:02}/{:04}'.format(
+                key % 100, key // 100 % 100, key // 10000))
+        except ValueError:
+            # Errors give the first timestamp on the day which isn't valid
+            raise invalid(int(np.argmax(inverse == i))) from None
+    return starts[inverse] + 3600 * hours + 60 * minutes + seconds
+
+
+def decode_each(decode_timestamp, timestamps):
+    """
+    Return int64 array of epoch seconds of a list of timestamps given as
+    UTF-8 bytes, decoded one at a time by decode_timestamp (for formats
+    whose timestamps vary in length).
+    """
+    return np.array(
+        [decode_timestamp(timestamp.decode('utf-8'))
+         for timestamp in timestamps], dtype=np.int64)
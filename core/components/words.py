@@ -0,0 +1,150 @@
+import heapq
+import string
+from collections import Counter
+from operator import itemgetter
+
+# Number of distinct words counted for each member before the least
+# frequent start being dropped (None to count every word exactly)
+WORD_CAPACITY = 2000
+# Number of messages whose words are counted at once
+COUNT_BATCH_SIZE = 10000
+# Words which are too common to be interesting
+STOP_WORDS = frozenset('''
+    a about after all also am an and any are as at be because been but by
+    can could did do does don't for from get got had has have he her him
+    his how i i'm if in into is it it's its just me my no not of on one
+    or our out so some than that that's the their them then there they
+    this to up us was we were what when which who will with would you
+    your
+'''.split())
+# Punctuation around words is ignored (apart from apostrophes, which are
+# usually part of them)
+PUNCTUATION = str.maketrans(
+    {character: ' '
+     for character in string.punctuation.replace("'", '') + '“”‘’…'})
+
+
+class WordCounter:
+    """
+    Counts of words which are exact until more than twice capacity
+    distinct words have been counted. From then on, only the capacity most
+    frequent words are kept whenever that happens again, so memory use is
+    bounded. The count of any word is then an underestimate by at most
+    error.
+    """
+
+    def __init__(self, capacity=WORD_CAPACITY):
+        self.capacity = capacity
+        self.counts = Counter()
+        self.error = 0
+
+    def update(self, words):
+        """Count each of iterable of words."""
+        self.counts.update(words)
+        if self.capacity is not None and len(self.counts) > 2 * self.capacity:
+            self.prune()
+
+    def prune(self):
+        """Drop all but the capacity most frequent words."""
+        kept = heapq.nlargest(
+            self.capacity + 1, self.counts.items(), key=itemgetter(1))
+        # Any word which is dropped was counted at most this many times
+        self.error += kept.pop()[1]
+        self.counts = Counter(dict(kept))
+
+
+class Vocabulary:
+    """
+    Vocabulary object which holds a word counter for each member of a
+    chat, filled in when the most used words are first needed so that
+    they can be found again without reading every message.
+    """
+
+    def __init__(self, capacity=WORD_CAPACITY, fold_case=True):
+        """
+        Optional Arguments:
+        capacity - see WordCounter
+        fold_case - count words regardless of their case
+        """
+        self.capacity = capacity
+        self.fold_case = fold_case
+        self.counters = []
+        # Number of messages at the start of the store which have been
+        # counted
+        self.size = 0
+
+    def counter(self, sender_id):
+        """Return word counter of member with sender id."""
+        while len(self.counters) <= sender_id:
+            self.counters.append(WordCounter(self.capacity))
+        return self.counters[sender_id]
+
+    def words(self, content):
+        """Return list of words in text content."""
+        if self.fold_case:
+            content = content.lower()
+        return content.translate(PUNCTUATION).split()
+
+    def count(self, store):
+        """Count words of the texts in store which haven't been counted."""
+        text = store.type_codes['text']
+        for start in range(self.size, len(store), COUNT_BATCH_SIZE):
+            end = min(start + COUNT_BATCH_SIZE, len(store))
+            type_ids = store.type_ids[start:end].tolist()
+            senders = store.senders[start:end].tolist()
+            # Each member's texts are joined so that they're split into
+            # words and counted all at once
+            texts = {}
+            for content, sender_id, type_id in zip(
+                    store.contents.decode(start, end), senders, type_ids):
+                if type_id == text:
+                    texts.setdefault(sender_id, []).append(content)
+            for sender_id, contents in texts.items():
+                self.counter(sender_id).update(
+                    self.words('\n'.join(contents)))
+        self.size = max(self.size, len(store))
+
+    def most_common(self, n, sender_ids=None, stop_words=STOP_WORDS):
+        """
+        Return (words, error) where words is a list of (word, count) pairs
+        of the n words used most by the members with sender ids (all
+        members if None), ignoring stop words, and error is the most any
+        count may be underestimated by.
+        """
+        if sender_ids is None:
+            sender_ids = range(len(self.counters))
+        counters = [self.counter(sender_id) for sender_id in sender_ids]
+        if len(counters) == 1:
+            counts = counters[0].counts
+        else:
+            counts = Counter()
+            for counter in counters:
+                counts.update(counter.counts)
+        words = heapq.nlargest(
+            n, ((word, count) for word, count in counts.items()
+                if word not in stop_words),
+            key=itemgetter(1))
+        return words, sum(counter.error for counter in counters)
+
+    def as_dict(self):
+        """Return vocabulary as dict which can be saved as JSON."""
+        return {
+            'capacity': self.capacity,
+            'fold_case': self.fold_case,
+            'size': self.size,
+            'counters': [[counter.counts, counter.error]
+                         for counter in self.counters],
+        }
+
+    @classmethod
+    def from_dict(cls, vocabulary_dict):
+        """Return vocabulary from dict given by as_dict."""
+        vocabulary = cls(
+            vocabulary_dict['capacity'], vocabulary_dict['fold_case'])
+        vocabulary.size = vocabulary_dict['size']
+        for counts, error in vocabulary_dict['counters']:
+            counter = WordCounter(vocabulary.capacity)
+            counter.counts = Counter(counts)
+            counter.error = error
+            vocabulary.counters.append(counter)
+        return vocabulary
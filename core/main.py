@@ -1,105 +1,226 @@
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from zipfile import ZipFile
+from zipfile import BadZipFile
 
 import wx
 
-from .components.charts import bar_chart, chart_title, doughnut_chart
-from .components.chat import Chat
-from .components.data import messages_sent_data, words_sent_data
-from .components.gui import MainFrame, CloseDialog, ImportDialog, LoadingDialog
-
-TEMP_PATH = Path('temp')
-CHAT_LOG_NAME = '_chat.txt'
-CHAT_LOG_PATH = TEMP_PATH / CHAT_LOG_NAME
+from .components.archive import load_chat
+from .components.cache import ChatCache
+from .components.charts import (bar_chart, chart_title, doughnut_chart,
+                                heatmap, line_chart, media_chart, pyplot,
+                                reply_matrix)
+from .components.data import (StatisticsCache, activity_data,
+                              conversations_started_data, heatmap_data,
+                              media_volume_data, messages_sent_data,
+                              most_used_words_data, replies_data,
+                              reply_time_data, words_sent_data)
+from .components.gui import (MainFrame, CloseDialog, ImportDialog,
+                             LoadingDialog, ReportDialog)
+from .components.progress import Progress
+from .components.report import Report
 
 CHAT_LOAD_EVENT_TYPE = wx.NewEventType()
 CHAT_LOAD_EVENT_BINDER = wx.PyEventBinder(CHAT_LOAD_EVENT_TYPE)
+STATISTIC_EVENT_TYPE = wx.NewEventType()
+STATISTIC_EVENT_BINDER = wx.PyEventBinder(STATISTIC_EVENT_TYPE)
+
+# Number of threads which compute statistics in the background
+STATISTIC_WORKERS = 2
+
+# Statistics which are totals for each member, so can be shown in any
+# chart style, rather than series of messages sent over time
+TOTAL_STATISTICS = ['Messages sent', 'Words sent', 'Most used words',
+                    'Conversations started']
+ACTIVITY_PERIODS = {
+    'Messages per day': 'day',
+    'Messages per week': 'week',
+    'Messages per month': 'month',
+}
 
 
 class ChatLoadThread(threading.Thread):
     """
-    Thread which: extracts chat log from zip file, initialises chat
-    object from chat log (whilst updating GUI loading dialog), then
-    posts ChatLoadEvent back to main thread.
+    Thread which: loads chat from cache if it's been imported before,
+    otherwise initialises chat object from chat log as it's streamed out
+    of zip file (whilst progress is shown by GUI loading dialog on the
+    main thread), then posts ChatLoadEvent back to main thread. If the
+    chat log is a later export of an earlier chat (given or in cache),
+    then only the new messages are parsed and added to a copy of it.
     """
 
-    def __init__(self, parent, zip_path, loading_dialog):
+    def __init__(self, parent, zip_path, loading_dialog, cache, chat=None):
         super().__init__()
         self.parent = parent
         self.zip_path = zip_path
         self.loading_dialog = loading_dialog
-        self.exit_flag = threading.Event()
-
-    def extract_chat_log(self, zip_path, destination_path):
-        """Extract chat log from chat log zip to destination path."""
-        with ZipFile(zip_path) as zip_obj:
-            zip_obj.extract(CHAT_LOG_NAME, path=str(destination_path))
+        self.cache = cache
+        self.chat = chat
+        self.progress = Progress(self.publish_progress)
+        self.report = Report('Import {}'.format(Path(zip_path).name))
 
     def run(self):
         try:
-            self.extract_chat_log(self.zip_path, TEMP_PATH)
-            chat = Chat(CHAT_LOG_PATH)
-            chat.load_messages(self.loading_dialog, self.exit_flag)
+            with self.report.phase('total'):
+                chat = load_chat(self.zip_path, self.cache, self.progress,
+                                 chat=self.chat, report=self.report)
             wx.CallAfter(self.loading_dialog.Destroy)
-            CHAT_LOG_PATH.unlink()
-            TEMP_PATH.rmdir()
-            if not self.exit_flag.is_set():
-                wx.PostEvent(self.parent, ChatLoadEvent(chat))
-        except OSError:
+            if not self.progress.is_cancelled():
+                wx.PostEvent(self.parent, ChatLoadEvent(chat, self.report))
+        except (OSError, BadZipFile):
             wx.LogError('Couldn\'t open zip file.')
         except KeyError:
             wx.LogError('Couldn\'t extract chat log.')
         except ValueError:
             wx.LogError('Chat log not valid.')
 
+    def publish_progress(self, proportion):
+        """Update loading dialog with progress on the main thread."""
+        wx.CallAfter(self.update_loading_dialog, proportion)
+
+    def update_loading_dialog(self, proportion):
+        """
+        Show proportion of chat log loaded in loading dialog, cancelling
+        loading if user has aborted it. Must be called on main thread.
+        """
+        keep_going, _ = self.loading_dialog.Update(int(100 * proportion))
+        if not keep_going:
+            self.progress.cancel()
+
 
 class ChatLoadEvent(wx.PyCommandEvent):
     """
     Event that signals chat object has been initialised and is ready to
-    be loaded.
+    be loaded, along with the report of how long it took.
     """
 
-    def __init__(self, chat):
+    def __init__(self, chat, report):
         super().__init__(eventType=CHAT_LOAD_EVENT_TYPE)
         self.chat = chat
+        self.report = report
+
+
+def statistic_data(chat, key):
+    """
+    Return data of statistic of chat described by key, which is a tuple of
+    (statistic, start date, end date, message type, member ids, member
+    generation), where member ids are the ids of the members whose most
+    used words are found (None for every member).
+    """
+    statistic, start_date, end_date, message_type, member_ids, _ = key
+    if statistic == 'Messages sent':
+        return messages_sent_data(chat, start_date, end_date, message_type)
+    elif statistic == 'Words sent':
+        return words_sent_data(chat, start_date, end_date)
+    elif statistic in ACTIVITY_PERIODS:
+        return activity_data(
+            chat, start_date, end_date, ACTIVITY_PERIODS[statistic])
+    elif statistic == 'Activity by hour':
+        return heatmap_data(chat, start_date, end_date)
+    elif statistic == 'Most used words':
+        members = None if member_ids is None else [
+            chat.members[member_id] for member_id in member_ids]
+        return most_used_words_data(chat, members)
+    elif statistic == 'Median reply time':
+        return reply_time_data(chat, start_date, end_date)
+    elif statistic == 'Who replies to whom':
+        return replies_data(chat, start_date, end_date)
+    elif statistic == 'Conversations started':
+        return conversations_started_data(chat, start_date, end_date)
+    elif statistic == 'Media sent':
+        return media_volume_data(chat, start_date, end_date)
+
+
+class StatisticEvent(wx.PyCommandEvent):
+    """
+    Event that signals the data of a statistic has been computed and its
+    chart is ready to be shown.
+    """
+
+    def __init__(self, chat, key, chart_style, data, report):
+        super().__init__(eventType=STATISTIC_EVENT_TYPE)
+        self.chat = chat
+        self.key = key
+        self.chart_style = chart_style
+        self.data = data
+        self.report = report
 
 
 class WhatStats(wx.App):
     """Program which generates statistics from WhatsApp chat logs."""
 
+    def __init__(self, startup_report=None):
+        """
+        Optional Arguments:
+        startup_report - report which the phases of starting the program
+                         are recorded in (e.g. with how long importing
+                         it took already recorded)
+        """
+        self.startup_report = startup_report or Report('Startup')
+        super().__init__()
+
     def OnInit(self):
-        self.frame = MainFrame()
+        with self.startup_report.phase('create window'):
+            self.frame = MainFrame()
         self.panel = self.frame.panel
         self.chat = None
+        self.cache = ChatCache()
+        # Reports of startup, the last import and the last chart generated
+        self.reports = {'startup': self.startup_report}
+        # Statistics are computed in the background and remembered, so
+        # that charts of the same data (e.g. in a different style) are
+        # shown instantly
+        self.executor = ThreadPoolExecutor(STATISTIC_WORKERS)
+        self.statistics_cache = StatisticsCache()
         self.bind_event_handlers()
         return True
 
     def start(self):
         """Start program."""
         self.toggle_inputs(False)
-        self.frame.Show()
+        with self.startup_report.phase('show window'):
+            self.frame.Show()
+        # Charts can't be generated until a chat has been imported, so
+        # plotting is imported in the background once the window is shown
+        # rather than delaying it
+        threading.Thread(target=self.preload_pyplot, daemon=True).start()
         self.MainLoop()
 
+    def preload_pyplot(self):
+        """
+        Import pyplot (in a background thread), then publish the startup
+        report. Charts which are generated before it's finished wait for
+        it rather than importing it again.
+        """
+        with self.startup_report.phase('import pyplot'):
+            pyplot()
+        self.startup_report.publish()
+
     def bind_event_handlers(self):
         """Bind events to their event handlers."""
         self.frame.Bind(wx.EVT_CLOSE, self.on_close)
         self.frame.Bind(CHAT_LOAD_EVENT_BINDER, self.on_chat_load)
+        self.frame.Bind(STATISTIC_EVENT_BINDER, self.on_statistic)
         self.frame.menu_bar.Bind(wx.EVT_MENU, self.on_import, id=wx.ID_OPEN)
+        self.frame.menu_bar.Bind(wx.EVT_MENU, self.on_update, id=wx.ID_REFRESH)
         self.frame.menu_bar.Bind(wx.EVT_MENU, self.on_quit, id=wx.ID_EXIT)
+        self.frame.menu_bar.Bind(wx.EVT_MENU, self.on_report, id=wx.ID_INFO)
 
         self.panel.subject_input.Bind(wx.EVT_KILL_FOCUS, self.on_subject_input)
+        self.panel.statistic_choices.Bind(
+            wx.EVT_RADIOBOX, self.on_statistic_choice)
         self.panel.generate_button.Bind(wx.EVT_BUTTON, self.on_generate)
 
     def on_close(self, event):
         """Ask user if they are sure they want to quit."""
         with CloseDialog(self.frame) as close_dialog:
             if close_dialog.ShowModal() == wx.ID_OK:
+                self.executor.shutdown(wait=False)
                 self.frame.Destroy()
             else:
                 event.Veto()
 
-    def on_import(self, event):
+    def on_import(self, event, chat=None):
         """
         Ask user to select chat log zip, then extract it and initialise
         Chat object in a seperate thread.
@@ -108,38 +229,143 @@ class WhatStats(wx.App):
             if import_dialog.ShowModal() != wx.ID_CANCEL:
                 zip_path = import_dialog.GetPath()
                 loading_dialog = LoadingDialog(self.frame)
-                thread = ChatLoadThread(self.frame, zip_path, loading_dialog)
+                thread = ChatLoadThread(
+                    self.frame, zip_path, loading_dialog, self.cache, chat)
                 thread.start()
 
+    def on_update(self, event):
+        """
+        Ask user to select a later export of the current chat's chat log
+        zip, then add the messages which have been sent since to it.
+        """
+        self.on_import(event, self.chat)
+
     def on_chat_load(self, event):
         """Set chat variable and initialise inputs with chat data."""
         self.chat = event.chat
+        self.statistics_cache.clear()
         self.init_inputs(self.chat)
+        self.reports['import'] = event.report
+        self.reports.pop('chart', None)
+        event.report.publish()
 
     def on_quit(self, event):
         self.frame.Close()
 
+    def on_report(self, event):
+        """Show report of the last import and chart generated."""
+        with ReportDialog(self.frame, self.reports.values()) as report_dialog:
+            report_dialog.ShowModal()
+
     def on_subject_input(self, event):
         """Set chat subject to contents of chat subject input."""
         self.chat.subject = self.panel.subject_input.GetValue()
 
+    def on_statistic_choice(self, event):
+        """
+        Only enable chart style choices if chosen statistic can be shown
+        in any chart style.
+        """
+        statistic = self.panel.statistic_choices.GetStringSelection()
+        self.panel.chart_style_choices.Enable(statistic in TOTAL_STATISTICS)
+
     def on_generate(self, event):
-        """Show chart of user's choice for chosen statistic."""
+        """
+        Show chart of user's choice for chosen statistic, computing its
+        data in the background unless it's been computed before.
+        """
         start = self.panel.start_date_input.GetValue()
         end = self.panel.end_date_input.GetValue()
         statistic = self.panel.statistic_choices.GetStringSelection()
         chart_style = self.panel.chart_style_choices.GetStringSelection()
 
-        if statistic == 'Messages sent':
-            data = messages_sent_data(self.chat, start, end)
-        elif statistic == 'Words sent':
-            data = words_sent_data(self.chat, start, end)
+        start_date = wx.wxdate2pydate(start).date()
+        end_date = wx.wxdate2pydate(end).date()
+        member_ids = None
+        if statistic == 'Most used words':
+            # Words are counted over the whole chat, for the members
+            # selected in the members list (or every member)
+            start_date = self.chat.start_date
+            end_date = self.chat.end_date
+            members = self.panel.members_list.GetSelectedObjects()
+            if members:
+                member_ids = tuple(member.id for member in members)
+        # Data names members, so it's stale once any have been renamed
+        key = (statistic, start_date, end_date, None, member_ids,
+               self.chat.members.generation)
+        report = Report('Generate {} {}'.format(
+            statistic.lower(), chart_style.lower()))
+        with report.phase('statistics cache lookup'):
+            data = self.statistics_cache.get(key)
+        if data is None:
+            self.executor.submit(
+                self.compute_statistic, self.chat, key, chart_style, report)
+        else:
+            self.show_chart(key, chart_style, data, report)
+
+    def compute_statistic(self, chat, key, chart_style, report):
+        """
+        Compute data of statistic described by key (see statistic_data)
+        in a worker thread, then post StatisticEvent back to main thread
+        (or log an error there if it couldn't be computed).
+        """
+        try:
+            counted = chat.vocabulary.size
+            with report.phase('statistics', len(chat.messages)):
+                data = statistic_data(chat, key)
+            if (chat.vocabulary.size != counted
+                    and chat.cache_key is not None):
+                # Words are only counted once they're needed, so they're
+                # saved with the cached chat so that they're not counted
+                # again
+                self.cache.save_vocabulary(chat.cache_key, chat)
+        except Exception as exception:
+            # Errors would otherwise be lost with the future of the worker
+            # thread, which nothing waits on
+            wx.CallAfter(wx.LogError, 'Couldn\'t compute {} ({}).'.format(
+                key[0].lower(), exception))
+            return
+        wx.PostEvent(
+            self.frame, StatisticEvent(chat, key, chart_style, data, report))
+
+    def on_statistic(self, event):
+        """Cache data of statistic and show its chart."""
+        # Chat may have been replaced whilst statistic was being computed
+        if event.chat is not self.chat:
+            return
+        self.statistics_cache.put(event.key, event.data)
+        self.show_chart(event.key, event.chart_style, event.data,
+                        event.report)
 
-        title = chart_title(statistic, self.chat, start, end)
-        if chart_style == 'Doughnut chart':
-            doughnut_chart(data, title)
-        elif chart_style == 'Bar chart':
-            bar_chart(data, title)
+    def show_chart(self, key, chart_style, data, report):
+        """Show chart of data of statistic described by key."""
+        statistic, start_date, end_date, _, member_ids, _ = key
+        name = statistic
+        if member_ids is not None:
+            name = '{} by {}'.format(statistic, ', '.join(
+                self.chat.members[member_id].name for member_id in member_ids))
+        elif statistic == 'Median reply time':
+            name = 'Median reply time (minutes)'
+        elif statistic == 'Media sent':
+            name = 'Media sent (MB)'
+        title = chart_title(name, self.chat, start_date, end_date)
+        with report.phase('chart rendering', len(data[0])):
+            if statistic in ACTIVITY_PERIODS:
+                line_chart(data, title)
+            elif statistic == 'Activity by hour':
+                heatmap(data, title)
+            elif statistic == 'Who replies to whom':
+                reply_matrix(data, title)
+            elif statistic == 'Median reply time':
+                bar_chart(data, title)
+            elif statistic == 'Media sent':
+                media_chart(data, title)
+            elif chart_style == 'Doughnut chart':
+                doughnut_chart(data, title)
+            elif chart_style == 'Bar chart':
+                bar_chart(data, title)
+        self.reports['chart'] = report
+        report.publish()
 
     def toggle_inputs(self, status):
         """Enable/disable inputs."""
@@ -157,3 +383,4 @@ class WhatStats(wx.App):
         self.panel.end_date_input.SetValue(chat.end_date)
         self.panel.members_list.set_members(chat.members)
         self.toggle_inputs(True)
+        self.on_statistic_choice(None)
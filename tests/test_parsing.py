@@ -0,0 +1,132 @@
+import io
+import random
+import re
+import unittest
+
+from benchmarks.generate import generate_chat_log
+from core.components.chat import Chat
+
+LRM = '‎'
+# Pieces which random lines are made up of, including the ones which the
+# parsers treat specially (senders, notices, attachments and line breaks)
+PIECES = ['A', 'Bé', ': ', ':', ' ', LRM, LRM + '<attached: 0001-PHOTO.jpg>',
+          'hi', '\n', '\r\n', 'x: y', '<Media omitted>',
+          'changed the subject to “S”', ' - ', '', '\n\n']
+CONTINUATIONS = ['cont: x', 'more', LRM + 'z', '']
+FORMATS = ['ios', 'android', 'ios-dmy']
+RANDOM_LOGS = 1000
+WORKERS = 3
+# Line breaks which are followed by the start of a message
+MESSAGE_BREAK_REGEX = re.compile(rb'\n(?=\[?\d{2}/)')
+
+
+def random_line(log_format, rng):
+    """Return random line of chat log in format, starting a message."""
+    body = ''.join(rng.choice(PIECES) for _ in range(rng.randrange(6)))
+    if log_format.startswith('android'):
+        return '01/02/2018, 09:{:02} - {}'.format(rng.randrange(60), body)
+    return '[01/02/2018, 09:00:{:02}] {}'.format(rng.randrange(60), body)
+
+
+def random_chat_log(log_format, rng):
+    """Return random chat log (bytes) in format."""
+    lines = [random_line(log_format, rng)]
+    for _ in range(rng.randrange(1, 8)):
+        if rng.random() < 0.7:
+            lines.append(random_line(log_format, rng))
+        else:
+            lines.append(rng.choice(CONTINUATIONS))
+    chat_log = rng.choice(['\n', '\r\n']).join(lines)
+    return (chat_log + rng.choice(['', '\n'])).encode('utf-8')
+
+
+def generated_chat_log(platform, messages=5000):
+    """Return synthetic chat log (bytes) exported from platform."""
+    chat_log_obj = io.StringIO()
+    generate_chat_log(chat_log_obj, messages, seed=1, platform=platform,
+                      attachments=True)
+    return chat_log_obj.getvalue().encode('utf-8')
+
+
+def snapshot(chat):
+    """
+    Return everything parsing a chat log finds: subject, members,
+    messages and fingerprint.
+    """
+    store = chat.store
+    store.finalise()
+    return (chat.subject, chat.subject_fixed,
+            [member.sender for member in chat.members],
+            store.timestamps.tolist(), store.senders.tolist(),
+            list(store.contents), chat.first_line_hash,
+            chat.last_message_offset, chat.last_message_size,
+            chat.last_message_hash)
+
+
+def parse(chat_log, log_format, backend):
+    """
+    Return snapshot of chat log (bytes) in format parsed with backend, or
+    None if it isn't valid.
+    """
+    chat = Chat(log_format=log_format)
+    try:
+        if backend == 'lines':
+            chat.parse_chat_log(io.BytesIO(chat_log))
+        else:
+            chat.parse_buffer(chat_log)
+    except ValueError:
+        return None
+    return snapshot(chat)
+
+
+class ParsingTest(unittest.TestCase):
+    """
+    Checks that every way of parsing a chat log finds the same messages
+    and fingerprint.
+    """
+
+    def test_backends(self):
+        rng = random.Random(0)
+        for _ in range(RANDOM_LOGS):
+            log_format = rng.choice(FORMATS)
+            chat_log = random_chat_log(log_format, rng)
+            with self.subTest(chat_log=chat_log, log_format=log_format):
+                self.assertEqual(parse(chat_log, log_format, 'lines'),
+                                 parse(chat_log, log_format, 'buffer'))
+
+    def test_generated_backends(self):
+        for platform in ['ios', 'android']:
+            chat_log = generated_chat_log(platform)
+            expected = parse(chat_log, platform, 'buffer')
+            with self.subTest(platform=platform):
+                self.assertIsNotNone(expected)
+                self.assertEqual(parse(chat_log, platform, 'lines'),
+                                 expected)
+
+    def test_parallel(self):
+        for platform in ['ios', 'android']:
+            chat_log = generated_chat_log(platform)
+            chat = Chat(log_format=platform)
+            self.assertTrue(chat.parse_parallel(chat_log, None, WORKERS))
+            with self.subTest(platform=platform):
+                self.assertEqual(snapshot(chat),
+                                 parse(chat_log, platform, 'buffer'))
+
+    def test_new_messages(self):
+        for platform in ['ios', 'android']:
+            chat_log = generated_chat_log(platform)
+            # Earlier exports may or may not end with a line break
+            middle = MESSAGE_BREAK_REGEX.search(
+                chat_log, len(chat_log) // 2).start()
+            for end in [middle, middle + 1]:
+                chat = Chat(io.BytesIO(chat_log[:end]), log_format=platform)
+                chat.load_messages(workers=1)
+                self.assertTrue(
+                    chat.load_new_messages(io.BytesIO(chat_log)))
+                with self.subTest(platform=platform, end=end):
+                    self.assertEqual(snapshot(chat),
+                                     parse(chat_log, platform, 'buffer'))
+
+
+if __name__ == '__main__':
+    unittest.main()